@@ -0,0 +1,51 @@
+from pymmax2.pyMMAX2 import *
+import sys, argparse, tempfile, tracemalloc, gc
+from timeit import default_timer as timer
+
+# Compare the BeautifulSoup and the streaming (lxml iterparse) basedata loaders, 
+# and the memory retained by the tuple and the columnar element storage.
+# Uses the supplied words file, or a synthetic one with --tokens elements.
+parser = argparse.ArgumentParser()
+parser.add_argument('--words_file', required=False, default=None)
+parser.add_argument('--tokens', required=False, type=int, default=100000)
+parser.add_argument('--runs', required=False, type=int, default=3)
+args=parser.parse_args()
+
+words_file=args.words_file
+if not words_file:
+	words_file=tempfile.mkstemp(suffix="_words.xml")[1]
+	with codecs.open(words_file, 'w', encoding="UTF-8") as bout:
+		bout.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE words SYSTEM "words.dtd">\n<words>\n')
+		for i in range(args.tokens):
+			if i%7==0:	bout.write('<word id="word_'+str(i)+'" spc="0">,</word>\n')
+			else:		bout.write('<word id="word_'+str(i)+'">token'+str(i%1000)+'</word>\n')
+		bout.write('</words>\n')
+
+results={}
+for (name, streaming, columnar) in [('soup', False, False), ('streaming', True, False), ('columnar', True, True)]:
+	best=None
+	for r in range(args.runs):
+		start=timer()
+		bd=Basedata(words_file, streaming=streaming, columnar=columnar)
+		t=timer()-start
+		best=t if best==None else min(best, t)
+	bd=None
+	tracemalloc.start()
+	bd=Basedata(words_file, streaming=streaming, columnar=columnar)
+	_, peak=tracemalloc.get_traced_memory()
+	# Memory still held by bd after loading
+	gc.collect()
+	retained, _=tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	results[name]=bd
+	print("%-10s: %7d elements, best of %d: %8.3f sec, peak memory %8.1f MB, retained %8.1f MB (%5.1f bytes per element)"%
+		(name, len(bd.get_elements()), args.runs, best, peak/(1024*1024), retained/(1024*1024), retained/max(1, len(bd.get_elements()))))
+
+assert results['soup'].get_elements()==results['streaming'].get_elements()
+assert results['soup'].BDID2LISTPOS==results['streaming'].BDID2LISTPOS
+assert results['soup'].get_elements()==list(results['columnar'].get_elements())
+assert results['soup'].BDID2LISTPOS==dict(results['columnar'].BDID2LISTPOS)
+print("Results are identical.")
+
+if not args.words_file:
+	os.remove(words_file)
@@ -0,0 +1,58 @@
+from pymmax2.pyMMAX2 import *
+import sys, argparse, tempfile, random, shutil, tracemalloc, gc
+from timeit import default_timer as timer
+
+# Memory benchmark for CompactMMAX2Markable. Creates a synthetic MMAX2 project, and loads its markable level
+# with MMAX2Markables and with CompactMMAX2Markables (load_markables(compact_markables=True)).
+# Reports the memory retained by the markables and the level bookkeeping, but not by the basedata, which is loaded before.
+# The markables must have identical spans.
+parser = argparse.ArgumentParser()
+parser.add_argument('--tokens', required=False, type=int, default=200000)
+parser.add_argument('--markables', required=False, type=int, default=50000)
+parser.add_argument('--max_len', required=False, type=int, default=30)
+args=parser.parse_args()
+
+random.seed(42)
+base=tempfile.mkdtemp()+os.path.sep
+for d in ['Basedata', 'Markables']:
+	os.makedirs(base+d)
+with codecs.open(base+'common_paths.xml', 'w', encoding="UTF-8") as cout:
+	cout.write('<?xml version="1.0"?>\n<common_paths>\n<basedata_path>Basedata/</basedata_path>\n<markable_path>Markables/</markable_path>\n'+
+		'<annotations>\n<level name="span" schemefile="span_scheme.xml" customization_file="span_customization.xml" namespace="www.pymmax2.org/NameSpaces/span">$_span_level.xml</level>\n</annotations>\n</common_paths>\n')
+with codecs.open(base+'bench.mmax', 'w', encoding="UTF-8") as mout:
+	mout.write('<?xml version="1.0" encoding="UTF-8"?>\n<mmax_project>\n<words>bench_words.xml</words>\n<keyactions></keyactions>\n<gestures></gestures>\n</mmax_project>')
+with codecs.open(base+'Basedata/bench_words.xml', 'w', encoding="UTF-8") as bout:
+	bout.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE words SYSTEM "words.dtd">\n<words>\n')
+	for i in range(args.tokens):
+		bout.write('<word id="word_'+str(i+1)+'">token'+str(i%1000)+'</word>\n')
+	bout.write('</words>\n')
+with codecs.open(base+'Markables/bench_span_level.xml', 'w', encoding="UTF-8") as lout:
+	lout.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE markables SYSTEM "markables.dtd">\n<markables xmlns="www.pymmax2.org/NameSpaces/span">\n')
+	for i in range(args.markables):
+		start=random.randint(1, args.tokens-args.max_len)
+		span='word_'+str(start)+'..word_'+str(start+random.randint(0, args.max_len-1))
+		lout.write('<markable id="markable_'+str(i)+'" span="'+span+'" mmax_level="span"/>\n')
+	lout.write('</markables>\n')
+
+results={}
+for (name, compact) in [('regular', False), ('compact', True)]:
+	pd=MMAX2Discourse(base+'bench.mmax')
+	gc.collect()
+	tracemalloc.start()
+	before, _=tracemalloc.get_traced_memory()
+	start=timer()
+	pd.load_markables(compact_markables=compact)
+	t=timer()-start
+	# Memory still held by the level after loading
+	gc.collect()
+	retained, _=tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	retained-=before
+	n=pd.get_level('span').get_markable_count()
+	results[name]=pd
+	print("%-8s: %7d markables, loaded in %7.3f sec, retained %8.1f MB (%6.1f bytes per markable)"%(name, n, t, retained/(1024*1024), retained/max(1, n)))
+
+assert ([m.get_spanlists() for m in results['regular'].get_level('span').get_markables()]==
+	[m.get_spanlists() for m in results['compact'].get_level('span').get_markables()])
+print("Spans are identical.")
+shutil.rmtree(base)
@@ -0,0 +1,90 @@
+from pymmax2.pyMMAX2 import *
+import sys, argparse, tempfile, random, shutil, contextlib, io
+from timeit import default_timer as timer
+
+# Benchmark for PhraseAnnotator. Creates a synthetic MMAX2 project and a phrase list with n-grams
+# from the document (and --phrases random ones), and applies it with PhraseAnnotator.apply and,
+# unless --skip_ngrams is given, with the old rendering and lookup of every n-gram (apply_ngrams) to a fresh copy.
+# The resulting phrase markables must be identical. Some basedata elements (like e-mail and U.S.) 
+# are not tokenized the way add_elements_from_string() would tokenize them.
+parser = argparse.ArgumentParser()
+parser.add_argument('--tokens', required=False, type=int, default=20000)
+parser.add_argument('--phrases', required=False, type=int, default=100000)
+parser.add_argument('--max_len', required=False, type=int, default=5)
+parser.add_argument('--allow_overlap', required=False, action='store_true')
+parser.add_argument('--case_sensitive', required=False, action='store_true')
+parser.add_argument('--skip_ngrams', required=False, action='store_true')
+args=parser.parse_args()
+
+random.seed(42)
+base=tempfile.mkdtemp()+os.path.sep
+for d in ['Basedata', 'Markables']:
+	os.makedirs(base+d)
+with codecs.open(base+'common_paths.xml', 'w', encoding="UTF-8") as cout:
+	cout.write('<?xml version="1.0"?>\n<common_paths>\n<basedata_path>Basedata/</basedata_path>\n<markable_path>Markables/</markable_path>\n'+
+		'<annotations>\n<level name="phrase" schemefile="phrase_scheme.xml" customization_file="phrase_customization.xml" namespace="www.pymmax2.org/NameSpaces/phrase">$_phrase_level.xml</level>\n</annotations>\n</common_paths>\n')
+with codecs.open(base+'bench.mmax', 'w', encoding="UTF-8") as mout:
+	mout.write('<?xml version="1.0" encoding="UTF-8"?>\n<mmax_project>\n<words>bench_words.xml</words>\n<keyactions></keyactions>\n<gestures></gestures>\n</mmax_project>')
+with codecs.open(base+'Basedata/bench_words.xml', 'w', encoding="UTF-8") as bout:
+	bout.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE words SYSTEM "words.dtd">\n<words>\n')
+	for i in range(args.tokens):
+		if i%9==0:		bout.write('<word id="word_'+str(i+1)+'" spc="0">,</word>\n')
+		elif i%13==0:	bout.write('<word id="word_'+str(i+1)+'">'+random.choice(['e-mail', 'U.S.', 'New York'])+'</word>\n')
+		else:			bout.write('<word id="word_'+str(i+1)+'">'+random.choice(['Token', 'token'])+str(random.randint(0, 300))+'</word>\n')
+	bout.write('</words>\n')
+with codecs.open(base+'Markables/bench_phrase_level.xml', 'w', encoding="UTF-8") as lout:
+	lout.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE markables SYSTEM "markables.dtd">\n<markables xmlns="www.pymmax2.org/NameSpaces/phrase">\n</markables>\n')
+
+pd=MMAX2Discourse(base+'bench.mmax')
+pd.load_markables()
+ids=[e[1] for e in pd.get_basedata().get_elements()]
+phrases=[]
+for i in range(args.phrases):
+	if i%10==0:
+		start=random.randint(0, len(ids)-args.max_len)
+		phrases.append(pd.render_string(for_ids=[ids[start:start+random.randint(1, args.max_len)]])[0].strip())
+	else:
+		phrases.append(" ".join("token"+str(random.randint(300, 100000)) for _ in range(random.randint(1, args.max_len))))
+
+start=timer()
+with contextlib.redirect_stdout(io.StringIO()):
+	annotator=PhraseAnnotator(phrases, ignore_case=not args.case_sensitive)
+t_init=timer()-start
+start=timer()
+pickled=pickle.dumps(annotator)
+annotator=pickle.loads(pickled)
+t_pickle=timer()-start
+print("Loaded %d phrases (max length %d) in %.3f sec, pickle round trip %.3f sec (%.1f MB)"%(len(annotator.PHRASES), annotator.MAX_LEN, t_init, t_pickle, len(pickled)/(1024*1024)))
+
+# The original PhraseAnnotator.apply: Render and look up every ngram of up to MAX_LEN tokens
+def apply_ngrams(discourse, targetlevel_name, allow_overlap=False):
+	elems=len(discourse.get_basedata().DCELEMENTS)
+	for o in range(elems):
+		for n in range(min(annotator.MAX_LEN+o, elems),o,-1):
+			ngram_span=[f[1] for f in discourse.get_basedata().DCELEMENTS[o:n]]
+			ngram=discourse.render_string(for_ids=[ngram_span])[0].strip()
+			if annotator.IGNORE_CASE:
+				ngram=ngram.lower()
+			if ngram in annotator.PHRASES:
+				if allow_overlap==False and any(len(discourse.get_level(targetlevel_name).get_markables_for_bd(spid))>0 for spid in ngram_span):
+					continue
+				discourse.get_level(targetlevel_name).add_markable([ngram_span])
+
+def run(method):
+	d=MMAX2Discourse(base+'bench.mmax')
+	d.load_markables()
+	start=timer()
+	# Overlaps are reported on stdout
+	with contextlib.redirect_stdout(io.StringIO()):
+		method(d, 'phrase', allow_overlap=args.allow_overlap)
+	t=timer()-start
+	return t, sorted(m.get_spanlists() for m in d.get_level('phrase').get_markables())
+
+t_apply, apply_spans=run(annotator.apply)
+print("Prefix search: %d phrase markables on %d tokens in %.3f sec"%(len(apply_spans), len(ids), t_apply))
+if not args.skip_ngrams:
+	t_ngrams, ngram_spans=run(apply_ngrams)
+	print("N-gram lookup: %d phrase markables on %d tokens in %.3f sec (%.0fx)"%(len(ngram_spans), len(ids), t_ngrams, t_ngrams/max(t_apply, 1e-9)))
+	assert apply_spans==ngram_spans
+	print("Results are identical.")
+shutil.rmtree(base)
@@ -0,0 +1,57 @@
+from pymmax2.pyMMAX2 import *
+import sys, argparse, tempfile, random, shutil
+from timeit import default_timer as timer
+
+# Regression benchmark for span expansion when loading markables. 
+# Creates a synthetic MMAX2 project, loads its markable level (which uses the fast path in
+# Basedata.interpolate_span), and compares this to the full scan on a sample of the spans.
+parser = argparse.ArgumentParser()
+parser.add_argument('--tokens', required=False, type=int, default=200000)
+parser.add_argument('--markables', required=False, type=int, default=50000)
+parser.add_argument('--max_len', required=False, type=int, default=30)
+# Scanning is O(document length) per span, so only a sample of spans is timed, and the time is extrapolated
+parser.add_argument('--scan_sample', required=False, type=int, default=200)
+args=parser.parse_args()
+
+random.seed(42)
+base=tempfile.mkdtemp()+os.path.sep
+for d in ['Basedata', 'Markables']:
+	os.makedirs(base+d)
+with codecs.open(base+'common_paths.xml', 'w', encoding="UTF-8") as cout:
+	cout.write('<?xml version="1.0"?>\n<common_paths>\n<basedata_path>Basedata/</basedata_path>\n<markable_path>Markables/</markable_path>\n'+
+		'<annotations>\n<level name="span" schemefile="span_scheme.xml" customization_file="span_customization.xml" namespace="www.pymmax2.org/NameSpaces/span">$_span_level.xml</level>\n</annotations>\n</common_paths>\n')
+with codecs.open(base+'bench.mmax', 'w', encoding="UTF-8") as mout:
+	mout.write('<?xml version="1.0" encoding="UTF-8"?>\n<mmax_project>\n<words>bench_words.xml</words>\n<keyactions></keyactions>\n<gestures></gestures>\n</mmax_project>')
+with codecs.open(base+'Basedata/bench_words.xml', 'w', encoding="UTF-8") as bout:
+	bout.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE words SYSTEM "words.dtd">\n<words>\n')
+	for i in range(args.tokens):
+		bout.write('<word id="word_'+str(i+1)+'">token'+str(i%1000)+'</word>\n')
+	bout.write('</words>\n')
+spans=[]
+with codecs.open(base+'Markables/bench_span_level.xml', 'w', encoding="UTF-8") as lout:
+	lout.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE markables SYSTEM "markables.dtd">\n<markables xmlns="www.pymmax2.org/NameSpaces/span">\n')
+	for i in range(args.markables):
+		start=random.randint(1, args.tokens-args.max_len)
+		span='word_'+str(start)+'..word_'+str(start+random.randint(1, args.max_len))
+		spans.append(span)
+		lout.write('<markable id="markable_'+str(i)+'" span="'+span+'" mmax_level="span"/>\n')
+	lout.write('</markables>\n')
+
+pd=MMAX2Discourse(base+'bench.mmax')
+start=timer()
+pd.load_markables()
+t_load=timer()-start
+print("Loaded %d markables on %d tokens in %.3f sec"%(pd.get_level('span').get_markable_count(), pd.get_bd_count(), t_load))
+
+bd=pd.get_basedata()
+sample=random.sample(spans, min(args.scan_sample, len(spans)))
+start=timer()
+fast=[bd.interpolate_span(*s.split("..")) for s in sample]
+t_fast=timer()-start
+start=timer()
+scan=[bd.interpolate_span_scan(*s.split("..")) for s in sample]
+t_scan=timer()-start
+assert fast==scan
+print("Span expansion for %d sampled spans: fast path %.4f sec, scan %.3f sec (%.0fx)"%(len(sample), t_fast, t_scan, t_scan/max(t_fast, 1e-9)))
+print("Extrapolated scan time for all %d spans: %.1f sec"%(len(spans), t_scan*len(spans)/len(sample)))
+shutil.rmtree(base)
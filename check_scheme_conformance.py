@@ -0,0 +1,73 @@
+from pymmax2.pyMMAX2 import *
+import jpype, sys, argparse
+from glob import glob
+
+# Checks that the pure-Python annotation scheme handling (MMAX2AnnotationScheme) behaves like the Java-based one.
+# Every .mmax file is loaded twice, once with the Java binding and once with python_schemes=True.
+# Then default attributes of all levels, normalized attribute names (for the attribute names of all markables and
+# of the annotation scheme, in different casings), and validation results for the attributes of all markables
+# (as is, and with each attribute removed in turn) are compared.
+# MMAX2Discourse(compiled_schemes=True) should only be used with schemes for which this reports no mismatches.
+
+parser = argparse.ArgumentParser()
+action = parser.add_mutually_exclusive_group(required=True)
+action.add_argument('--mmax_file', default = None)
+action.add_argument('--mmax_dir', default = None)
+parser.add_argument('--common_paths', required = False,  default = "")
+# Provide path to Libs folder in MMAX2 installation (required, since the Java-based handling is the reference)
+parser.add_argument('--mmax2_libs',  required = True)
+parser.add_argument('--show', required = False, type = int, default = 5)
+args=parser.parse_args()
+
+MMAX2_CLASSPATH	= ""
+for f in [f for f in glob(args.mmax2_libs+'**', recursive=True) if f.endswith(".jar")]:
+	MMAX2_CLASSPATH+=f+":"	# use ; instead of : for Windows
+jpype.startJVM(jpype.getDefaultJVMPath(), "-Djava.class.path="+MMAX2_CLASSPATH)
+
+if args.mmax_dir:
+	files = [f for f in glob(args.mmax_dir+'**', recursive=True) if f.endswith(".mmax")]
+else:
+	files = [args.mmax_file]
+
+# Cast to str explicitly because names and values might come from Java
+def normalized(result):
+	validation_errors, _, valid, invalid, missing = result
+	return (bool(validation_errors),) + tuple({str(k):str(v) for (k,v) in d.items()} for d in (valid, invalid, missing))
+
+checked, mismatches = 0, []
+for f in files:
+	java_d   = MMAX2Discourse(f, common_paths=args.common_paths, mmax2_java_binding=jpype, compiled_schemes=False)
+	python_d = MMAX2Discourse(f, common_paths=args.common_paths, python_schemes=True)
+	for d in (java_d, python_d):
+		try:
+			d.load_markables()
+		except MultipleInvalidMMAX2AttributeExceptions:
+			pass
+	for java_l in java_d.get_levels():
+		python_l = python_d.get_level(java_l.get_name())
+		java_defaults   = [(int(t), str(a), str(v), bool(b)) for (t,a,v,b) in java_l.get_default_attributes()[0]]
+		python_defaults = [(int(t), str(a), str(v), bool(b)) for (t,a,v,b) in python_l.get_default_attributes()[0]]
+		checked+=1
+		if java_defaults != python_defaults:
+			mismatches.append((f, java_l.get_name(), "defaults", java_defaults, python_defaults))
+		if java_l.get_J_MMAX2ATTRIBUTEPANEL()!=None and python_l.get_annotation_scheme()!=None:
+			names=set(str(k) for m in python_l.get_markables() for k in m.get_attributes())
+			for att in python_l.get_annotation_scheme().get_attributes():
+				names.update([att.get_display_name(), att.get_lowercased_name(), att.get_display_name().upper(), att.get_display_name().title()])
+			for name in sorted(names):
+				checked+=1
+				java_n, python_n = str(java_l.get_J_MMAX2ATTRIBUTEPANEL().normalizeAttributeName(name)), python_l.get_annotation_scheme().normalize_attribute_name(name)
+				if java_n != python_n:
+					mismatches.append((f, java_l.get_name(), "normalized name of "+name, java_n, python_n))
+		for m in python_l.get_markables():
+			atts = {str(k):str(v) for (k,v) in m.get_attributes().items()}
+			for supplied in [atts]+[{k:v for (k,v) in atts.items() if k != r} for r in atts]:
+				checked+=1
+				java_r, python_r = normalized(java_l.validate(supplied.copy())), normalized(python_l.validate(supplied.copy()))
+				if java_r != python_r:
+					mismatches.append((f, java_l.get_name(), supplied, java_r, python_r))
+
+print("%s checks, %s mismatches"%(str(checked), str(len(mismatches))))
+for (f, level, supplied, java_r, python_r) in mismatches[:args.show]:
+	print("%s, level %s\n\tSupplied: %s\n\tJava:     %s\n\tPython:   %s"%(f, level, str(supplied), str(java_r), str(python_r)))
+sys.exit(1 if len(mismatches)>0 else 0)
@@ -25,7 +25,7 @@ else:
 	files = [args.mmax_file]
 
 for f in files:
-	pd = MMAX2Discourse(f, common_paths=args.common_paths, mmax2_java_binding=jpype if jpype.isJVMStarted() else None)
+	pd = MMAX2Discourse(f, common_paths=args.common_paths, mmax2_java_binding=jpype if jpype.isJVMStarted() else None, shared_common_paths=True)
 	try:
 		pd.load_markables(verbose=False)
 	except MultipleInvalidMMAX2AttributeExceptions as mive:
@@ -1,4 +1,4 @@
-import sys, os, codecs, pkg_resources, colorama, binascii, time
+import sys, os, codecs, pkg_resources, colorama, binascii, time, pickle, hashlib, random, mmap
 
 from bs4.builder import XMLParsedAsHTMLWarning
 import warnings
@@ -7,13 +7,19 @@ warnings.filterwarnings('ignore', category=XMLParsedAsHTMLWarning)
 
 from bs4 import BeautifulSoup as bs
 from bs4.dammit import EncodingDetector
+from lxml import etree
 
 from xml.sax.saxutils import escape 
 from colorama import Fore, Back, Style
 import unicodedata
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import regex as re
 from operator import itemgetter
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Sequence, Mapping
+from array import array
+from bisect import bisect_left, bisect_right
 
 #try:
 #    from Bio import pairwise2
@@ -53,6 +59,13 @@ STYLE_STUB          = '<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Tra
 
 MMAX2_DEFAULT_NAMESPACE   = "www.mmax2.net/NameSpaces/"
 
+# Process-wide caches (see get_cached_for_file()) of common_paths files to their parsed configuration, 
+# and of *_scheme.xml files to MMAX2AnnotationScheme instances. Each keeps at most the given number of files.
+COMMONPATHS_CONFIG_CACHE            = OrderedDict()
+COMMONPATHS_CONFIG_CACHE_MAX_SIZE   = 100
+ANNOTATION_SCHEME_CACHE             = OrderedDict()
+ANNOTATION_SCHEME_CACHE_MAX_SIZE    = 100
+
 LEVEL_STUB          = "<?xml version='1.0' encoding='UTF-8'?>\n\
                        <!DOCTYPE markables SYSTEM 'markables.dtd'>\n\
                        <markables xmlns='"+MMAX2_DEFAULT_NAMESPACE+"__LEVELNAME__'>\n\
@@ -111,7 +124,23 @@ class MMAX2Discourse(object):                       #
     # If mmax2_java_binding is available, this will create a 
     # native J_MMAX2DISCOURSE instance to enable access 
     # to the native attribute panels.   
-    def __init__(self, mmax2file, common_paths="", verbose=False, max_size=-1, mmax2_java_binding=None):
+    # If cache_dir is supplied, parsed basedata and markables are stored in, and re-used from, 
+    # snapshot files in that directory (see MMAX2SnapshotCache).
+    # With shared_common_paths=True, the parsed common_paths file is shared by all discourses in this process,
+    # as long as the file does not change. Each discourse still gets its own MMAX2MarkableLevel instances.
+    # This is useful when opening many discourses with one global common_paths file, as MMAX2Corpus does.
+    # columnar_basedata=True uses the compact ColumnarElements storage for basedata.
+    # streaming=False reads basedata and markables with the original BeautifulSoup readers instead of the lxml streaming ones
+    # (see Basedata and MMAX2MarkableLevel.load_markables()).
+    # With python_schemes=True and no mmax2_java_binding, annotation schemes are read with MMAX2AnnotationScheme, 
+    # which supports validation, default attributes and attribute name normalization without the Java MMAX2 libraries.
+    # Results should be the same as with the Java libraries, as long as check_scheme_conformance.py reports no mismatches.
+    # With compiled_schemes=True and mmax2_java_binding, validation and default attributes also use the 
+    # MMAX2SchemeTable compiled from the scheme file, instead of calling the Java attribute panel for every markable.
+    # This is off by default, since the Java attribute panel is the reference. Only switch it on for schemes for which
+    # check_scheme_conformance.py reports no mismatches.
+    def __init__(self, mmax2file, common_paths="", verbose=False, max_size=-1, mmax2_java_binding=None, cache_dir=None, shared_common_paths=False, columnar_basedata=False, python_schemes=False, 
+                 compiled_schemes=False, streaming=True):
         if verbose: 
             print(f'\n{Back.GREEN}{Fore.BLACK}{Style.NORMAL}This is {Fore.RED}{Style.BRIGHT}pyMMAX2{Fore.BLACK}{Style.NORMAL}'+
                 ' version '+pkg_resources.require("PyMMAX2")[0].version+f'{Style.RESET_ALL}', 
@@ -121,6 +150,10 @@ class MMAX2Discourse(object):                       #
         # These are the main references to these two objects
         self.MMAX2_JAVA_BINDING     =   mmax2_java_binding # This is the jpype reference
         self.J_MMAX2DISCOURSE       =   None
+        self.SNAPSHOT_CACHE         =   MMAX2SnapshotCache(cache_dir, verbose=verbose) if cache_dir else None
+        self.PYTHON_SCHEMES         =   python_schemes
+        self.COMPILED_SCHEMES       =   compiled_schemes
+        self.STREAMING              =   streaming
 
         if not os.path.exists(mmax2file):
             raise MMAX2FileNotFoundException(mmax2file)
@@ -154,10 +187,10 @@ class MMAX2Discourse(object):                       #
         # Open common_paths.xml
         cp = MMAX2CommonPaths(full_common_paths, discourse=self, verbose=verbose)
         # Read, this includes initializing of all markable levels (no loading of markables, though)
-        cp.read(verbose=verbose)
+        cp.read(shared=shared_common_paths, verbose=verbose)
 
         # Load basedata (this can only happen after cp has been read)       
-        bd_size=proj.load_basedata(cp, verbose=verbose)
+        bd_size=proj.load_basedata(cp, snapshot_cache=self.SNAPSHOT_CACHE, columnar=columnar_basedata, streaming=streaming, verbose=verbose)
         # Skip loading if max_size is set and bd_size is too high
         if max_size!= -1 and bd_size>max_size:
             raise MaxSizeException("("+str(bd_size)+") "+mmax2file)
@@ -176,13 +209,65 @@ class MMAX2Discourse(object):                       #
     # raised from the MMAX2Discourse 'constructor'.    
     # 
     # When this method is called on a discourse w/o jpype connection, it will *never* raise any validation exceptions
-    def load_markables(self, verbose=False, allow_duplicate_spans=True):
+    #
+    # With lazy=True, levels only record their markable file here, and are loaded (and validated) 
+    # the first time they are accessed via get_level(), get_markablelevel_by_name(), get_levels(),
+    # get_markable_from_level() or get_annotations_for_basedata().
+    # Validation exceptions of a lazily loaded level are raised from that first access.
+    #
+    # levels is an optional list of level names to load. Markable files of all other levels are never opened,
+    # and these levels stay empty. attributes is an optional dict of level name to list of attribute names.
+    # Attributes not in the list are dropped before the markable is created. Levels not in attributes keep all of theirs.
+    # Only the listed attributes are validated (in the context of all attributes read, for validate="eager"), 
+    # and only missing listed attributes are added with their default values.
+    # With compact_markables=True, markables are created as CompactMMAX2Markables.
+    # With attribute_index=True, every level keeps an inverted attribute index (see MMAX2MarkableLevel.set_attribute_index()).
+    #
+    # validate controls validation of the attributes read from the markable files (if an annotation scheme is available):
+    # "eager" validates every markable when it is loaded. 
+    # "deferred" assigns the attributes as read, and records the markables for a later call to validate_all().
+    # "off" assigns the attributes as read, without recording anything.
+    # With "deferred" and "off", missing attributes do *not* get their default values until the markables are validated,
+    # by validate_all() (or validate_all(pending_only=False) for "off"). Until then, get_attributes() returns what is in the file.
+    # Later changes via update_attributes() etc. are always validated.
+    def load_markables(self, verbose=False, allow_duplicate_spans=True, lazy=False, levels=None, attributes=None, compact_markables=False, attribute_index=False, 
+                       validate="eager"):
+        if validate not in ("eager", "deferred", "off"):
+            raise ValueError("validate must be 'eager', 'deferred' or 'off', not "+str(validate))
         # This will collect individual InvalidMMX2AttributeException instances, if any, 
         # and be raised if at least one of these occurred.
         multi_val_exceptions=MultipleInvalidMMAX2AttributeExceptions()
         # This will also load all markables, and init the java-based annotation 
         # scheme class, if mmax2_java_binding is available on DISCOURSE
-        self.COMMONPATHS.initialize(self.MMAX2_PROJECT, multi_val_exceptions, allow_duplicate_spans=allow_duplicate_spans, verbose=verbose)
+        self.COMMONPATHS.initialize(self.MMAX2_PROJECT, multi_val_exceptions, allow_duplicate_spans=allow_duplicate_spans, lazy=lazy, 
+            levels=levels, attributes=attributes, compact_markables=compact_markables, attribute_index=attribute_index, validate=validate, verbose=verbose)
+        if multi_val_exceptions.get_exception_count()>0:
+            raise multi_val_exceptions
+
+    # Validates markables that were loaded with validate="deferred" and have not been validated since, 
+    # or all markables if pending_only=False. levels is an optional list of level names.
+    # With sample=n, only n randomly chosen markables per level (out of the ones above) are validated.
+    # Levels are validated one after the other, in the calling thread: The Java attribute panel must not be used concurrently, 
+    # and validation with the python scheme table is CPU-bound, so threads would not make it faster. 
+    # Since each distinct attribute dict is validated only once per level (see validate_markables()), there is little left to parallelize.
+    # Raises MultipleInvalidMMAX2AttributeExceptions like load_markables(), with exceptions in level order.
+    def validate_all(self, levels=None, sample=None, pending_only=True, verbose=False):
+        multi_val_exceptions=MultipleInvalidMMAX2AttributeExceptions()
+        # Only requested levels are loaded, if they are pending
+        for lev in self.get_commonpaths().get_levels():
+            if levels!=None and lev.get_name() not in levels:
+                continue
+            try:
+                lev.load_pending_markables(verbose=verbose)
+            except MultipleInvalidMMAX2AttributeExceptions as mive:
+                # Level was loaded with validate="eager"
+                for exc in mive.exceptions:
+                    multi_val_exceptions.add(exc)
+            markables=lev.get_unvalidated_markables() if pending_only else list(lev.MARKABLES)
+            if sample!=None and sample<len(markables):
+                chosen=set(random.sample(range(len(markables)), sample))
+                markables=[m for (i,m) in enumerate(markables) if i in chosen]
+            lev.validate_markables(markables, multi_val_exceptions=multi_val_exceptions, verbose=verbose)
         if multi_val_exceptions.get_exception_count()>0:
             raise multi_val_exceptions
 
@@ -190,6 +275,7 @@ class MMAX2Discourse(object):                       #
         res=[]
         for lev in self.COMMONPATHS.MARKABLELEVELS:
             if not competitor_level_names or lev.get_name() in competitor_level_names:
+                lev.load_pending_markables()
                 for m in lev.get_markables_for_basedata(bd_id):
                     res.append((m,lev))
         return res
@@ -197,6 +283,7 @@ class MMAX2Discourse(object):                       #
     def get_markable_from_level(self, levelname, m_id):
         for lev in self.COMMONPATHS.MARKABLELEVELS:
             if lev.get_name()==levelname:
+                lev.load_pending_markables()
                 return lev.get_markable_by_id(m_id)
 
     def get_basedata_path(self):
@@ -214,12 +301,28 @@ class MMAX2Discourse(object):                       #
     def get_J_MMAX2DISCOURSE(self):
         return self.J_MMAX2DISCOURSE
 
+    def get_python_schemes(self):
+        return self.PYTHON_SCHEMES
+
+    def get_compiled_schemes(self):
+        return self.COMPILED_SCHEMES
+
+    def get_streaming(self):
+        return self.STREAMING
+
     def get_mmax2_java_binding(self):
         return self.MMAX2_JAVA_BINDING
 
     def get_mmax2_project(self):
         return self.MMAX2_PROJECT
 
+    def get_snapshot_cache(self):
+        return self.SNAPSHOT_CACHE
+
+    # Files every snapshot of this discourse depends on, in addition to the cached file itself
+    def get_snapshot_sources(self):
+        return [self.MMAX2_PROJECT.FILE, self.COMMONPATHS.FILE]
+
     def info(self, mono=False):
         res="\nMMAX2 Project Info:\n"
         res=res+"-------------------\n"
@@ -232,7 +335,7 @@ class MMAX2Discourse(object):                       #
             res=res+"Basedata elements :"+ str(self.get_bd_count())+"\n"
             res=res+"Markable levels   :\n"
 
-        for i in self.COMMONPATHS.MARKABLELEVELS:
+        for i in self.get_levels():
             def_att_string="Annotation scheme instance not available!"
             default_attrib_list, _ = i.get_default_attributes()
             if default_attrib_list != None:
@@ -282,6 +385,7 @@ class MMAX2Discourse(object):                       #
         for i in self.COMMONPATHS.MARKABLELEVELS:
             if i.get_name()==name:
                 r=i
+                r.load_pending_markables(verbose=verbose)
                 if verbose: print("Found level %s with %s markables (%s)."%(name, str(len(i.get_all_markables())),str(i) ), file=sys.stderr)
                 break
         if r == None:
@@ -437,15 +541,25 @@ class MMAX2Discourse(object):                       #
     def get_mmax2_path(self, full=False):
         return self.MMAX2_PROJECT.get_mmax2_path(full=full)
 
+    # Each regex is matched once against the whole document (see Basedata.match_document()), and each match is then 
+    # assigned to all markables on on_levels with a fragment containing it. Since the document is matched, matches 
+    # crossing a markable boundary are not found for that markable (and anchors and lookarounds see the context). 
+    # Returns one list per markable with at least one match, in the format of Basedata.match_string_impl().
     def match(self, bd_type="", regexes=[], on_levels=[], attrs_to_match={}, ignore_case=False, verbose=False, teststring=None):
         r=[]
+        basedata=self.get_basedata(bd_type=bd_type) if bd_type!="" else self.get_basedata()
+        doc_results=basedata.match_document(regexes, ignore_case=ignore_case, verbose=verbose)
         for l_name in on_levels:
             level=self.get_markablelevel_by_name(l_name)
+            # markable to dict of regex index to results_for_reg
+            found={}
+            for (i, (doc_matches, _, _, _)) in enumerate(doc_results):
+                for (first_pos, last_pos, span_for_match, _) in doc_matches:
+                    for markable in level.get_markables_containing(first_pos, last_pos):
+                        found.setdefault(markable,{}).setdefault(i,[]).append([span_for_match])
             for markable in level.get_all_markables():
-                if markable.matches_all(attrs_to_match):
-                    tr=match_basedata(regexes, markable.get_spanlists(), self.get_basedata(bd_type=bd_type), ignore_case=ignore_case, verbose=verbose, teststring=teststring)
-                    if tr!=[]:
-                        r.append(tr)
+                if markable in found and markable.matches_all(attrs_to_match):
+                    r.append([(results_for_reg,)+doc_results[i][1:] for (i, results_for_reg) in sorted(found[markable].items())])
         return r
 
     def write_all(self):
@@ -462,6 +576,9 @@ class MMAX2Discourse(object):                       #
         return self.get_basedata().render_hybrid_string(for_ids=for_ids, markables=markables, verbose=verbose)
 
     def get_levels(self):
+        # Callers get direct access to all levels, so load all pending ones
+        for l in self.get_commonpaths().get_levels():
+            l.load_pending_markables()
         return self.get_commonpaths().get_levels()
 
     # bd_list is a flat list of bd_ids. 
@@ -496,7 +613,9 @@ class MMAX2Discourse(object):                       #
                 raise NoMarkableSpanException(seg)
             # Mod: Allow . in numeric id parts to support tokens with float ids
             if re.match(r'word\_[0-9.]+\.\.word\_[0-9.]+', seg):
-                spanlist=self.get_basedata().interpolate_span(seg.split("..")[0],seg.split("..")[1])
+                first_id, last_id = seg.split("..")[0:2]
+                # interpolate_span looks up both ids directly, and only scans for non-monotonic ids
+                spanlist=self.get_basedata().interpolate_span(first_id, last_id)
             elif re.match(r'word\_[0-9.]+', seg):
                 spanlist=[seg]
             else:
@@ -553,72 +672,260 @@ class MMAX2Discourse(object):                       #
 
 
     def kwic_string_for_elements(self, bd_id_list, width=5, fillwidth=100, lsep="_>>", rsep="<<_", html=False, strip=False, markup_level=None, markup_color=""):
+        return next(self.kwic_strings_for_elements([bd_id_list], width=width, fillwidth=fillwidth, lsep=lsep, rsep=rsep, html=html, strip=strip, 
+                                                    markup_level=markup_level, markup_color=markup_color))
+
+    # Generator version of kwic_string_for_elements for many hits. 
+    # hits is an iterable of bd_id lists or markables, and one kwic string is yielded per hit.
+    # Context windows are found via BDID2LISTPOS, so the cost per hit does not depend on the document length.
+    def kwic_strings_for_elements(self, hits, width=5, fillwidth=100, lsep="_>>", rsep="<<_", html=False, strip=False, markup_level=None, markup_color=""):
         basedata = self.get_basedata()
-        pre_bd_tmp, lpadded=basedata.get_preceding_elements(bd_id_list[0], width=width)
-        # Make sure that atts is not None (which is the default for memory economy)
-        pre_bd=[]
-        for (s,bdid,pos,att) in pre_bd_tmp:
-            if att==None:
-                att={}
-            pre_bd.append((s,bdid,pos,att))
-
-        fol_bd_tmp, rpadded=basedata.get_following_elements(bd_id_list[-1], width=width)
-        fol_bd=[]
-        for (s,bdid,pos,att) in fol_bd_tmp:
-            if att==None:
-                att={}
-            fol_bd.append((s,bdid,pos,att))
-
-        lc,rc="",""
-
-        if lpadded: lc="*B_O_BDATA*"
-        for text, spc, bdid in [(t[0], int(t[3].get('spc','1')),t[1]) for t in pre_bd]:
-            starts_markable, ends_markable = False,False
-            if markup_level!=None and len(markup_level.get_started_markables(bdid))>0:
-                starts_markable=True
-            if markup_level!=None and len(markup_level.get_ended_markables(bdid))>0:
-                ends_markable=True
-            if html and starts_markable:
-                lc=lc+(" "*spc)+"["+text
-            else:
-                lc=lc+(" "*spc)+text
-            if html and ends_markable:
-                lc=lc+"]"
-
-
-        for text, spc, bdid in [(t[0], int(t[3].get('spc','1')), t[1]) for t in fol_bd]:
-            starts_markable, ends_markable = False,False
-            if markup_level!=None and len(markup_level.get_started_markables(bdid))>0:
-                starts_markable=True
-            if markup_level!=None and len(markup_level.get_ended_markables(bdid))>0:
-                ends_markable=True
-            if html and starts_markable:
-                rc=rc+(" "*spc)+"["+text
-            else:
-                rc=rc+(" "*spc)+text
-            if html and ends_markable:
-                rc=rc+"]"
+        for hit in hits:
+            bd_id_list = flatten_spanlists(hit.get_spanlists()) if isinstance(hit, MMAX2Markable) else hit
+            pre_bd_tmp, lpadded=basedata.get_preceding_elements(bd_id_list[0], width=width)
+            # Make sure that atts is not None (which is the default for memory economy)
+            pre_bd=[]
+            for (s,bdid,pos,att) in pre_bd_tmp:
+                if att==None:
+                    att={}
+                pre_bd.append((s,bdid,pos,att))
+
+            fol_bd_tmp, rpadded=basedata.get_following_elements(bd_id_list[-1], width=width)
+            fol_bd=[]
+            for (s,bdid,pos,att) in fol_bd_tmp:
+                if att==None:
+                    att={}
+                fol_bd.append((s,bdid,pos,att))
+
+            lc,rc="",""
+
+            if lpadded: lc="*B_O_BDATA*"
+            for text, spc, bdid in [(t[0], int(t[3].get('spc','1')),t[1]) for t in pre_bd]:
+                starts_markable, ends_markable = False,False
+                if markup_level!=None and len(markup_level.get_started_markables(bdid))>0:
+                    starts_markable=True
+                if markup_level!=None and len(markup_level.get_ended_markables(bdid))>0:
+                    ends_markable=True
+                if html and starts_markable:
+                    lc=lc+(" "*spc)+"["+text
+                else:
+                    lc=lc+(" "*spc)+text
+                if html and ends_markable:
+                    lc=lc+"]"
+
+
+            for text, spc, bdid in [(t[0], int(t[3].get('spc','1')), t[1]) for t in fol_bd]:
+                starts_markable, ends_markable = False,False
+                if markup_level!=None and len(markup_level.get_started_markables(bdid))>0:
+                    starts_markable=True
+                if markup_level!=None and len(markup_level.get_ended_markables(bdid))>0:
+                    ends_markable=True
+                if html and starts_markable:
+                    rc=rc+(" "*spc)+"["+text
+                else:
+                    rc=rc+(" "*spc)+text
+                if html and ends_markable:
+                    rc=rc+"]"
 
-        if rpadded:
-            rc=" "+rc+ "*E_O_BDATA*"
-        else:
-            rc=" "+rc
-        # One space exactly at start of rc
-        rc=" "+rc.lstrip()
-
-        match_string=basedata.render_string_impl([bd_id_list], brackets=False, mapping=False)[0]
-        if markup_level!=None and len(markup_level.get_started_markables(bd_id_list[0]))>0:
-            match_string="["+match_string.strip()
-        if markup_level!=None and len(markup_level.get_ended_markables(bd_id_list[-1]))>0:
-            match_string=match_string+"]"
+            if rpadded:
+                rc=" "+rc+ "*E_O_BDATA*"
+            else:
+                rc=" "+rc
+            # One space exactly at start of rc
+            rc=" "+rc.lstrip()
+
+            match_string=basedata.render_string_impl([bd_id_list], brackets=False, mapping=False)[0]
+            if markup_level!=None and len(markup_level.get_started_markables(bd_id_list[0]))>0:
+                match_string="["+match_string.strip()
+            if markup_level!=None and len(markup_level.get_ended_markables(bd_id_list[-1]))>0:
+                match_string=match_string+"]"
  
-        if match_string.startswith(" ")==False:   # Make sure key words are always padded with a leading space, even if spc=0
-            match_string=" "+match_string
+            if match_string.startswith(" ")==False:   # Make sure key words are always padded with a leading space, even if spc=0
+                match_string=" "+match_string
                    
-        if strip: 
-            match_string=match_string.strip()
-        kwic_string = lc.rjust(fillwidth)+lsep+match_string+rsep+rc
-        return kwic_string
+            if strip: 
+                match_string=match_string.strip()
+            kwic_string = lc.rjust(fillwidth)+lsep+match_string+rsep+rc
+            yield kwic_string
+
+
+#####################################################
+class MMAX2Corpus(object):                          #
+# Loads and processes many .mmax files in parallel  #
+#####################################################
+    # mmax2_source is a directory (searched recursively for .mmax files) or a glob pattern.
+    # All discourses are created with the same common_paths (which might be "", see MMAX2Discourse).
+    # Each worker process creates its own discourses, so a java binding cannot be passed in.
+    # Instead, if mmax2_classpath is supplied, each worker starts its own JVM with it.
+    def __init__(self, mmax2_source, common_paths="", workers=None, chunksize=1, mmax2_classpath=None, cache_dir=None, verbose=False):
+        self.SOURCE                 = mmax2_source
+        self.COMMONPATHS            = common_paths
+        self.WORKERS                = workers
+        self.CHUNKSIZE              = chunksize
+        self.MMAX2_CLASSPATH        = mmax2_classpath
+        self.CACHE_DIR              = cache_dir
+        self.VERBOSE                = verbose
+        # File name to MultipleInvalidMMAX2AttributeExceptions, for all files that had validation errors
+        self.VALIDATION_EXCEPTIONS  = OrderedDict()
+        # File name to error message, for all files that could not be processed
+        self.ERRORS                 = OrderedDict()
+
+        if os.path.isdir(self.SOURCE):
+            self.FILES = sorted([f for f in glob(os.path.join(self.SOURCE, '**'), recursive=True) if f.endswith(".mmax")])
+        else:
+            self.FILES = sorted([f for f in glob(self.SOURCE, recursive=True) if f.endswith(".mmax")])
+        if verbose: print("Found "+str(len(self.FILES))+" .mmax files in "+str(self.SOURCE), file=sys.stderr)
+
+    def get_files(self):
+        return self.FILES
+
+    def get_validation_exceptions(self):
+        return self.VALIDATION_EXCEPTIONS
+
+    def get_errors(self):
+        return self.ERRORS
+
+    # Yields (file, result) tuples in the order of get_files(), where result is map_func(discourse), 
+    # or a summary dict (see summarize_discourse()) if no map_func is supplied.
+    # map_func must be picklable, i.e. defined at module level, and should return picklable results.
+    # load_args are passed to MMAX2Discourse.load_markables().
+    # Validation exceptions do not stop processing. They are collected per file in get_validation_exceptions().
+    # Neither do other errors (e.g. unparsable XML or MaxSizeException) in a file: Its result is None (or 
+    # {'file':file, 'error':message} for summaries), and the message is collected per file in get_errors().
+    def map(self, map_func=None, **load_args):
+        self.VALIDATION_EXCEPTIONS=OrderedDict()
+        self.ERRORS=OrderedDict()
+        jobs=[(f, self.COMMONPATHS, self.CACHE_DIR, map_func, load_args) for f in self.FILES]
+        with ProcessPoolExecutor(max_workers=self.WORKERS, initializer=_init_corpus_worker, initargs=(self.MMAX2_CLASSPATH,)) as executor:
+            for (f, result, multi_val_exceptions, error) in executor.map(_process_corpus_file, jobs, chunksize=self.CHUNKSIZE):
+                self.collect_problems(f, multi_val_exceptions, error)
+                yield (f, result)
+
+    def collect_problems(self, f, multi_val_exceptions, error):
+        if multi_val_exceptions!=None:
+            if self.VERBOSE: print(str(multi_val_exceptions.get_exception_count())+" validation exceptions in "+f, file=sys.stderr)
+            self.VALIDATION_EXCEPTIONS[f]=multi_val_exceptions
+        if error!=None:
+            if self.VERBOSE: print("Error in "+f+": "+error, file=sys.stderr)
+            self.ERRORS[f]=error
+
+    # Returns a list of summary dicts, one per file
+    def summarize(self, **load_args):
+        return [result for (_, result) in self.map(**load_args)]
+
+    # Yields one (file, label, spanlists, matched string) record per match of any of regexes, in the order of get_files().
+    # regexes is a list of (regex, label) tuples as for MMAX2Discourse.match(), and is matched against each document as a whole.
+    # If on_levels is supplied, only matches contained in a markable on one of these levels that matches_all(attrs_to_match) are yielded.
+    # Files are searched in worker processes, and at most max_pending files (default: twice the number of workers) are 
+    # searched ahead of the caller, so memory does not grow with the size of the corpus.
+    # load_args are passed to MMAX2Discourse.load_markables(), and validation exceptions and errors are collected as for map().
+    # For a file that could not be searched, a single (file, None, None, error message) record is yielded.
+    def search(self, regexes, on_levels=None, attrs_to_match={}, ignore_case=False, precompiled=False, max_pending=None, **load_args):
+        self.VALIDATION_EXCEPTIONS=OrderedDict()
+        self.ERRORS=OrderedDict()
+        if max_pending==None:
+            max_pending=2*(self.WORKERS if self.WORKERS else (os.cpu_count() or 1))
+        jobs=((f, self.COMMONPATHS, self.CACHE_DIR, regexes, on_levels, attrs_to_match, ignore_case, precompiled, load_args) for f in self.FILES)
+        with ProcessPoolExecutor(max_workers=self.WORKERS, initializer=_init_corpus_worker, initargs=(self.MMAX2_CLASSPATH,)) as executor:
+            for (f, records, multi_val_exceptions, error) in _bounded_map(executor, _search_corpus_file, jobs, max_pending):
+                self.collect_problems(f, multi_val_exceptions, error)
+                if error!=None:
+                    yield (f, None, None, error)
+                yield from records
+
+
+def summarize_discourse(discourse):
+    return {'file':                 discourse.get_mmax2_path(full=True),
+            'basedata_elements':    discourse.get_bd_count(),
+            'markables':            OrderedDict([(l.get_name(), l.get_markable_count()) for l in discourse.get_levels()])}
+
+# Java binding of the current MMAX2Corpus worker process, if any
+_CORPUS_WORKER_BINDING = None
+
+def _init_corpus_worker(mmax2_classpath):
+    global _CORPUS_WORKER_BINDING
+    if mmax2_classpath:
+        import jpype
+        if not jpype.isJVMStarted():
+            jpype.startJVM(jpype.getDefaultJVMPath(), "-Djava.class.path="+mmax2_classpath)
+        _CORPUS_WORKER_BINDING = jpype
+
+# Loads the markables of discourse, and (if load_args make loading lazy) the ones of the levels in level_names, 
+# or of all levels if level_names is None. Returns all validation exceptions in one MultipleInvalidMMAX2AttributeExceptions, or None.
+def _load_corpus_discourse(discourse, load_args, level_names=None):
+    multi_val_exceptions=MultipleInvalidMMAX2AttributeExceptions()
+    try:
+        discourse.load_markables(**load_args)
+    except MultipleInvalidMMAX2AttributeExceptions as mive:
+        multi_val_exceptions.exceptions.extend(mive.exceptions)
+    for level in discourse.get_commonpaths().get_levels():
+        if level_names==None or level.get_name() in level_names:
+            try:
+                level.load_pending_markables()
+            except MultipleInvalidMMAX2AttributeExceptions as mive:
+                multi_val_exceptions.exceptions.extend(mive.exceptions)
+    return multi_val_exceptions if multi_val_exceptions.get_exception_count()>0 else None
+
+# Exceptions are returned as messages, because not all of them can be pickled
+def _corpus_error_message(exc):
+    return type(exc).__name__+": "+str(exc)
+
+def _process_corpus_file(job):
+    mmax2file, common_paths, cache_dir, map_func, load_args = job
+    multi_val_exceptions, error = None, None
+    try:
+        discourse=MMAX2Discourse(mmax2file, common_paths=common_paths, mmax2_java_binding=_CORPUS_WORKER_BINDING, cache_dir=cache_dir, 
+                                 shared_common_paths=True)
+        # summarize_discourse() needs all levels. map_func gets the lazy ones, if any, as they are.
+        multi_val_exceptions=_load_corpus_discourse(discourse, load_args, level_names=[] if map_func else None)
+        result=map_func(discourse) if map_func else summarize_discourse(discourse)
+    except Exception as exc:
+        error=_corpus_error_message(exc)
+        result=None if map_func else {'file': mmax2file, 'error': error}
+    return (mmax2file, result, multi_val_exceptions, error)
+
+def _search_corpus_file(job):
+    mmax2file, common_paths, cache_dir, regexes, on_levels, attrs_to_match, ignore_case, precompiled, load_args = job
+    multi_val_exceptions=None
+    try:
+        discourse=MMAX2Discourse(mmax2file, common_paths=common_paths, mmax2_java_binding=_CORPUS_WORKER_BINDING, cache_dir=cache_dir, 
+                                 shared_common_paths=True)
+        multi_val_exceptions=_load_corpus_discourse(discourse, load_args, level_names=on_levels if on_levels else [])
+        return (mmax2file, _search_corpus_discourse(mmax2file, discourse, regexes, on_levels, attrs_to_match, ignore_case, precompiled), multi_val_exceptions, None)
+    except Exception as exc:
+        return (mmax2file, [], multi_val_exceptions, _corpus_error_message(exc))
+
+def _search_corpus_discourse(mmax2file, discourse, regexes, on_levels, attrs_to_match, ignore_case, precompiled):
+    levels=[discourse.get_level(l_name) for l_name in on_levels] if on_levels else None
+    # Markable to result of matches_all(attrs_to_match)
+    filter_cache={}
+    records=[]
+    for (doc_matches, _, label, _) in discourse.get_basedata().match_document(regexes, ignore_case=ignore_case, precompiled=precompiled):
+        for (first_pos, last_pos, span_for_match, matched) in doc_matches:
+            if levels!=None:
+                found=False
+                for level in levels:
+                    for m in level.get_markables_containing(first_pos, last_pos):
+                        if m not in filter_cache:
+                            filter_cache[m]=m.matches_all(attrs_to_match)
+                        if filter_cache[m]:
+                            found=True
+                            break
+                    if found: break
+                if not found:
+                    continue
+            records.append((mmax2file, label, discourse.bd_list_to_spanlists(span_for_match), matched))
+    return records
+
+# Like executor.map(func, jobs), but jobs are submitted only while less than max_pending results are waiting to be yielded
+def _bounded_map(executor, func, jobs, max_pending):
+    pending=deque()
+    for job in jobs:
+        pending.append(executor.submit(func, job))
+        if len(pending)>=max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
 
 
 #################################
@@ -634,12 +941,29 @@ class MMAX2MarkableLevel(object):
         self.SCHEME                 = scheme        if scheme           !="" else name+"_scheme.xml"
         self.CUSTOMIZATION          = customization if customization    !="" else name+"_customization.xml"
         self.MARKABLES              = list()
+        # Markables in discourse order, with sort keys (start position, creation sequence no.) at the same index in ORDER_KEYS. 
+        # Maintained by add_markable() and delete_markable().
+        self.ORDERED_MARKABLES      = list()
+        self.ORDER_KEYS             = list()
+        self.MARKABLE2ORDERKEY      = {}
+        self.ORDER_SEQ              = 0
+        # Interval index over the fragments of all markables, for overlap and containment queries
+        self.SPAN_INDEX             = MMAX2SpanIndex()
+        # Span key (see get_span_key()) to markables with this span, in creation order. Maintained by add_markable() and delete_markable().
+        self.SPAN2MARKABLES         = {}
+        # Basedata id to markables, in creation order. CompactMMAX2Markables are not registered here, but found via SPAN_INDEX, 
+        # so that their memory use does not grow with the length of their span. COMPACT_COUNT is the number of these.
         self.BASEDATA2MARKABLELISTS = {}
+        self.COMPACT_COUNT          = 0
         self.NAMESPACE              = namespace
         self.ENCODING               = encoding
         self.DTD_PATH               = dtd_path
         self.DISCOURSE              = discourse
         self.J_MMAX2ATTRIBUTEPANEL  = None
+        # MMAX2AnnotationScheme, used instead of J_MMAX2ATTRIBUTEPANEL if the latter is not available
+        self.ANNOTATION_SCHEME      = None
+        # Its compiled MMAX2SchemeTable, used for validation and default attributes if available
+        self.SCHEME_TABLE           = None
         self.FILENAME_IS_EXPANDED   = False
         self.AT_STARTUP             = at_startup
 
@@ -647,6 +971,36 @@ class MMAX2MarkableLevel(object):
 
         self.ID2MARKABLE            = {}
 
+        # If True, new markables are created as CompactMMAX2Markables
+        self.COMPACT_MARKABLES      = False
+
+        # Optional inverted index attribute name -> value -> set of markables, None if not used
+        self.ATTRIBUTE_INDEX        = None
+
+        # (markable_path, allow_duplicate_spans, attributes, validate) while loading of this level's markables is deferred
+        self.PENDING_LOAD           = None
+
+        # List of attribute names the markables were loaded with (see load_markables()), or None for all.
+        # Only these are validated and get missing defaults in validate_markables().
+        self.ATTRIBUTE_FILTER       = None
+        # True if the level was not requested in MMAX2Discourse.load_markables(levels=...), so its markables were never read
+        self.SKIPPED                = False
+
+        # Results of validate(), keyed by the frozen supplied attribute dict. 
+        # Most markables share a few attribute dicts, and validation is expensive (in particular against the Java scheme).
+        self.VALIDATION_CACHE           = {}
+        self.VALIDATION_CACHE_MAX_SIZE  = 100000
+        # Only updated by validate() of this level, which (like the Java attribute panel) is not meant for concurrent use.
+        self.VALIDATION_CACHE_HITS      = 0
+        self.VALIDATION_CACHE_MISSES    = 0
+        # Result of get_default_attributes(), and attribute name -> normalized name for normalize_attributes()
+        self.DEFAULT_ATTRIBUTES         = None
+        self.NORMALIZED_NAMES           = {}
+
+        # Markables loaded with validate="deferred" that have not been validated yet, in load order. 
+        # Values are all attributes as read (for validating the filtered ones, see ATTRIBUTE_FILTER), or None w/o a filter.
+        self.UNVALIDATED                = {}
+
         if self.DISCOURSE and self.DISCOURSE.get_J_MMAX2DISCOURSE()!=None:
             # This only means that connections to schemes exist, but this specific level might not exist yet!
             if verbose: print("Getting reference to native Java MMAX2MarkableLevel "+self.NAME+" ", file=sys.stderr)
@@ -654,6 +1008,7 @@ class MMAX2MarkableLevel(object):
             tmp_lev=self.DISCOURSE.get_J_MMAX2DISCOURSE().getMarkableLevelByName(self.NAME,False)
             if verbose: print(f'{Fore.MAGENTA}{Style.BRIGHT}'+str(tmp_lev)+f'{Style.RESET_ALL}', file=sys.stderr)
             self.J_MMAX2ATTRIBUTEPANEL = tmp_lev.getCurrentAnnotationScheme().getCurrentAttributePanel()
+            self.clear_scheme_caches()
             self.J_MMAX2ATTRIBUTEPANEL.setAttributePanelContainer(self.DISCOURSE.get_mmax2_java_binding().JClass('org.eml.MMAX2.gui.windows.MMAX2AttributePanelContainer')())
 
     def __repr__(self):
@@ -663,6 +1018,53 @@ class MMAX2MarkableLevel(object):
     def get_J_MMAX2ANNOTATIONSCHEME(self):
         return self.DISCOURSE.get_J_MMAX2DISCOURSE().getMarkableLevelByName(self.NAME,False).getCurrentAnnotationScheme()
 
+    # Create markables added from now on as CompactMMAX2Markables (or not)
+    def set_compact_markables(self, compact=True):
+        self.COMPACT_MARKABLES=compact
+
+    # Keep (or stop keeping) an inverted index from attribute names and values to markables. 
+    # The index is built from the current markables, and then updated by MMAX2Markable.update_attributes(), 
+    # remove_attribute(), to_default() and delete_markable(). Changes made directly to the dict returned by 
+    # MMAX2Markable.get_attributes() are not seen by the index.
+    def set_attribute_index(self, index=True):
+        if not index:
+            self.ATTRIBUTE_INDEX=None
+        elif self.ATTRIBUTE_INDEX==None:
+            self.ATTRIBUTE_INDEX={}
+            for m in self.MARKABLES:
+                self.index_attributes(m)
+
+    def has_attribute_index(self):
+        return self.ATTRIBUTE_INDEX!=None
+
+    # Add m's current attribute values to ATTRIBUTE_INDEX (if any)
+    def index_attributes(self, m):
+        if self.ATTRIBUTE_INDEX!=None:
+            for (k,v) in m.ATTRIBUTES.items():
+                # Cast to str explicitly because values might come from Java
+                try:
+                    self.ATTRIBUTE_INDEX[k][str(v)].add(m)
+                except KeyError:
+                    self.ATTRIBUTE_INDEX.setdefault(k,{}).setdefault(str(v),set()).add(m)
+
+    # Remove m's current attribute values (or only those in atts) from ATTRIBUTE_INDEX (if any)
+    def unindex_attributes(self, m, atts=None):
+        if self.ATTRIBUTE_INDEX!=None:
+            for (k,v) in (atts if atts!=None else m.ATTRIBUTES).items():
+                vals=self.ATTRIBUTE_INDEX.get(k,{})
+                ms=vals.get(str(v),None)
+                if ms!=None:
+                    ms.discard(m)
+                    if len(ms)==0:
+                        del vals[str(v)]
+
+    # Markables from ATTRIBUTE_INDEX, in the order of MARKABLES (=creation order)
+    def get_indexed_markables(self, att, val):
+        ms=self.ATTRIBUTE_INDEX.get(att,{}).get(str(val),())
+        if len(ms)<2:
+            return list(ms)
+        return sorted(ms, key=lambda m: self.MARKABLE2ORDERKEY[m][1])
+
     def set_at_startup(self, mode):
         self.AT_STARTUP=mode
 
@@ -675,7 +1077,11 @@ class MMAX2MarkableLevel(object):
     def get_filename_is_expanded(self):
         return self.FILENAME_IS_EXPANDED
 
-    def write(self, to_path="", overwrite=False, no_backup=False, verbose=False):
+    # Levels which were skipped, loaded with an attribute filter, or not loaded yet are not written, 
+    # since this would drop markables or attributes from the file, unless allow_incomplete=True.
+    def write(self, to_path="", overwrite=False, no_backup=False, allow_incomplete=False, verbose=False):
+        if not allow_incomplete and not self.is_complete():
+            raise IncompleteMarkableLevelException(self.NAME, self.get_incompleteness())
         if to_path=="":
             as_file=self.FILE
         else:
@@ -711,12 +1117,21 @@ class MMAX2MarkableLevel(object):
     def get_J_MMAX2MARKABLELEVEL(self):
         return(self.get_discourse().get_J_MMAX2DISCOURSE().getMarkableLevelByName(self.NAME, False))
 
+    # Normalized names only depend on the annotation scheme, so they are cached in NORMALIZED_NAMES
     def normalize_attributes(self, atts):
         # todo normalize values as well
+        if self.J_MMAX2ATTRIBUTEPANEL == None and self.ANNOTATION_SCHEME == None:
+            return atts
         tatts=atts.copy()
         for (k,v) in tatts.items():
-            s = self.J_MMAX2ATTRIBUTEPANEL.getAnnotationScheme()            
-            nname=str(self.J_MMAX2ATTRIBUTEPANEL.normalizeAttributeName(k))
+            try:
+                nname=self.NORMALIZED_NAMES[k]
+            except KeyError:
+                if self.J_MMAX2ATTRIBUTEPANEL != None:
+                    nname=str(self.J_MMAX2ATTRIBUTEPANEL.normalizeAttributeName(k))
+                else:
+                    nname=self.ANNOTATION_SCHEME.normalize_attribute_name(k)
+                self.NORMALIZED_NAMES[k]=nname
             if nname!=k:
                 # The normalization caused a spelling change
                 # print(k," --> ",nname)
@@ -730,6 +1145,8 @@ class MMAX2MarkableLevel(object):
     # Go over all default attributes in order.
     # Go over all existing attributes in dict, and try to consume them, by setting their current value to the scheme attribute
     # For branching attributes, this will activate potential dependent attributes, which will be processed recursively
+    # If available, SCHEME_TABLE does the same in Python, without any calls to J_MMAX2ATTRIBUTEPANEL.
+    # Results of either are kept in VALIDATION_CACHE.
     def validate(self, supplied):
         validation_errors=False
         # supplied is a dict of plain a-v pairs, representing a markable's attributes on the python/xml level.
@@ -737,7 +1154,20 @@ class MMAX2MarkableLevel(object):
         consumed    = []    # Stores names of attributes that had valid values and could be consumed; will be removed from remaining later
         valid       = {}
         missing     = {}    # a-v pairs required by default or as the result of branching attribute setting, but missing in supplied
-        if self.J_MMAX2ATTRIBUTEPANEL != None:
+        if self.SCHEME_TABLE == None and self.J_MMAX2ATTRIBUTEPANEL == None:
+            return validation_errors, supplied, valid, invalid, missing
+        # Cast to str explicitly because names and values might come from Java
+        cache_key=frozenset((str(k),str(v)) for (k,v) in supplied.items())
+        cached=self.VALIDATION_CACHE.get(cache_key,None)
+        if cached!=None:
+            self.VALIDATION_CACHE_HITS+=1
+            # Return copies, since callers might modify the dicts
+            validation_errors, valid, invalid, missing = cached
+            return validation_errors, supplied, valid.copy(), invalid.copy(), missing.copy()
+        self.VALIDATION_CACHE_MISSES+=1
+        if self.SCHEME_TABLE != None:
+            validation_errors, _, valid, invalid, missing = self.SCHEME_TABLE.validate(supplied)
+        else:
             #invalid     = self.normalize_attributes(supplied).copy()   # Copy, because it will be modified. Should be empty after validation            
             invalid     = supplied.copy()   # Copy, because it will be modified. Should be empty after validation                        
             # Reset (invisible) panel to only contain independent attributes with default values.
@@ -791,25 +1221,33 @@ class MMAX2MarkableLevel(object):
 
             # Make sure that *extra* attributes which could not be consumed also trigger a validation exception, just like missing ones
             if len(invalid)>0 or len(missing)>0:    validation_errors=True
+        if len(self.VALIDATION_CACHE)<self.VALIDATION_CACHE_MAX_SIZE:
+            self.VALIDATION_CACHE[cache_key]=(validation_errors, valid.copy(), invalid.copy(), missing.copy())
         return validation_errors, supplied, valid, invalid, missing
 
     # This returns (None, None) if no connection to annotation scheme is available,
     # and (empty list, empty dict) if no attributes are defined
+    # The result is computed once and kept in DEFAULT_ATTRIBUTES until clear_scheme_caches() is called.
     def get_default_attributes(self):
-        def_att_list=[]
-        def_att_dict={}
-        if self.J_MMAX2ATTRIBUTEPANEL!=None:
+        if self.DEFAULT_ATTRIBUTES==None:
             def_att_list=[]
             def_att_dict={}
-            # Reset (invisible) panel to only contain independent attributes with default values
-            self.J_MMAX2ATTRIBUTEPANEL.displayMarkableAttributes(None)
-            for a in self.J_MMAX2ATTRIBUTEPANEL.getAllCurrentAttributes():
-                # type, name, val, branching
-                def_att_list.append((a.getType(), a.getDisplayName(), a.getDefaultValue(), a.getIsBranching()))
-                # lowercased name, default val
-                #def_att_dict[a.getLowerCasedAttributeName()]=a.getDefaultValue()
-                def_att_dict[a.getDisplayName()]=a.getDefaultValue()
-        return def_att_list, def_att_dict
+            if self.SCHEME_TABLE!=None:
+                def_att_list, def_att_dict = self.SCHEME_TABLE.get_default_attributes()
+            elif self.J_MMAX2ATTRIBUTEPANEL!=None:
+                def_att_list=[]
+                def_att_dict={}
+                # Reset (invisible) panel to only contain independent attributes with default values
+                self.J_MMAX2ATTRIBUTEPANEL.displayMarkableAttributes(None)
+                for a in self.J_MMAX2ATTRIBUTEPANEL.getAllCurrentAttributes():
+                    # type, name, val, branching
+                    def_att_list.append((a.getType(), a.getDisplayName(), a.getDefaultValue(), a.getIsBranching()))
+                    # lowercased name, default val
+                    #def_att_dict[a.getLowerCasedAttributeName()]=a.getDefaultValue()
+                    def_att_dict[a.getDisplayName()]=a.getDefaultValue()
+            self.DEFAULT_ATTRIBUTES=(def_att_list, def_att_dict)
+        # Return copies, since the dict might become the attributes of a markable (see add_markable())
+        return list(self.DEFAULT_ATTRIBUTES[0]), dict(self.DEFAULT_ATTRIBUTES[1])
 
 
     # Central method for creating markables and adding them to this level
@@ -819,29 +1257,23 @@ class MMAX2MarkableLevel(object):
     # No validation is done here, since no attributes are processed.
     def add_markable(self, spanlists, m_id="", allow_overlap=True, allow_duplicate_spans=False, apply_default=False, verbose=False):
         existing, overlapping   = None, None
-        empty_span              = True  # Assume empty span at first
-        # Go over span of new markable
-        # Outer span
-        for span in spanlists:
-            # BD per span
-            for bd in span:
-                empty_span=False
-                # Go over all existing markables (if any)
-                for m in self.BASEDATA2MARKABLELISTS.get(bd,[]):
-                    # Check for identity, which is illegal (on the same level!!) if allow_duplicate_spans == False
-                    #if not allow_duplicate_spans and m.get_span() == spanlists_to_span(spanlists) :# and m.get_attributes() == attribs:
-                    if not allow_duplicate_spans and m.get_spanlists() == spanlists :# and m.get_attributes() == attribs:
-                        existing=m
-                        break
-                    #if not allow_overlap and      overlap(m.get_span(),      spanlists_to_span(spanlists),self.get_discourse().get_basedata() ):
-                    #if not allow_overlap and span_overlap(m.get_spanlists(), spanlists, self.get_discourse().get_basedata() ):
-                    if not allow_overlap and span_overlap(m.get_spanlists(), spanlists):
-                        overlapping=m
-                        break
-                if existing or overlapping:
-                    break
-            if existing or overlapping:
-                break
+        empty_span              = not any(spanlists)
+        ranges                  = self.get_discourse().get_basedata().get_ranges(spanlists) if not empty_span else []
+        if not allow_overlap and not empty_span:
+            # Overlapping means sharing at least one basedata element, so this includes markables with an identical span. 
+            # Report the one that shares the earliest element (the first one created of these), like a left-to-right search would, 
+            # and only report it as identical if it is.
+            overlaps=self.SPAN_INDEX.get_overlaps(ranges)
+            if len(overlaps)>0:
+                overlapping=min(overlaps, key=overlaps.get)
+                if not allow_duplicate_spans and any(m is overlapping for m in self.SPAN2MARKABLES.get(self.get_span_key(spanlists, ranges),[])):
+                    existing, overlapping = overlapping, None
+        elif not allow_duplicate_spans and not empty_span:
+            # Check for identity, which is illegal (on the same level!!) if allow_duplicate_spans == False
+            # Report the first markable created with this span
+            same_span=self.SPAN2MARKABLES.get(self.get_span_key(spanlists, ranges),None)
+            if same_span:
+                existing=same_span[0]
         if existing:
             if verbose: print("Identical markable exists, skipping",existing.to_xml(), existing.get_spanlists(), file=sys.stderr)
             return (False, existing)
@@ -862,17 +1294,26 @@ class MMAX2MarkableLevel(object):
                 if int(m_id.split("_")[1]) >= self.MAX_ID:
                     self.MAX_ID=int(m_id.split("_")[1])+1
             # Create Markable, w/o attributes
-            self.MARKABLES.append(MMAX2Markable(spanlists, self, m_id, verbose=verbose))
+            if self.COMPACT_MARKABLES:
+                self.MARKABLES.append(CompactMMAX2Markable(spanlists, self, m_id, verbose=verbose))
+            else:
+                self.MARKABLES.append(MMAX2Markable(spanlists, self, m_id, verbose=verbose))
             # Register
             new_m=self.MARKABLES[-1]
-            for spanlist in spanlists:
-                for bd in spanlist:
-                    try:
-                        self.BASEDATA2MARKABLELISTS[bd].append(new_m)
-                    except KeyError:
-                        self.BASEDATA2MARKABLELISTS[bd]=[new_m]
+            if self.COMPACT_MARKABLES:
+                self.COMPACT_COUNT+=1
+            else:
+                for spanlist in spanlists:
+                    for bd in spanlist:
+                        try:
+                            self.BASEDATA2MARKABLELISTS[bd].append(new_m)
+                        except KeyError:
+                            self.BASEDATA2MARKABLELISTS[bd]=[new_m]
 
             self.ID2MARKABLE[m_id]=new_m
+            self.SPAN2MARKABLES.setdefault(self.get_span_key(spanlists, ranges),[]).append(new_m)
+            self.add_to_order(new_m)
+            self.SPAN_INDEX.add(new_m, ranges, self.MARKABLE2ORDERKEY[new_m][1])
 
             if apply_default:
                 _,def_atts=self.get_default_attributes()
@@ -880,11 +1321,53 @@ class MMAX2MarkableLevel(object):
 #               new_m.update_attributes(def_atts)
                 # Do not validate, as these are the complete default atts already
                 new_m.ATTRIBUTES=def_atts
+                self.index_attributes(new_m)
             return (True, self.MARKABLES[-1])
         else:
             # print("Not creating markable with empty span on level %s!"%self.NAME, file=sys.stderr)
             return (False, None)
 
+    # Returns a hashable key for spanlists, which is the same for all markables with identical spanlists.
+    # If each fragment is one run of consecutive basedata elements (the usual case), this is the tuple of their 
+    # (start_pos, end_pos) ranges (see Basedata.get_ranges()), the size of which does not depend on the length of the span.
+    # ranges can be supplied if they have been computed for spanlists already.
+    def get_span_key(self, spanlists, ranges=None):
+        if ranges==None:
+            ranges=self.get_discourse().get_basedata().get_ranges(spanlists)
+        if len(ranges)==len(spanlists):
+            return tuple(ranges)
+        return tuple(tuple(spanlist) for spanlist in spanlists)
+
+    # Returns the markables with exactly spanlists as their span, in creation order
+    def get_markables_by_span(self, spanlists):
+        try:
+            span_key=self.get_span_key(spanlists)
+        except KeyError:
+            # Unknown basedata id
+            return []
+        return list(self.SPAN2MARKABLES.get(span_key,[]))
+
+    # Insert m into ORDERED_MARKABLES. Markables with the same start position stay in creation order.
+    # Markables are usually created in discourse order, so this is mostly an append.
+    def add_to_order(self, m):
+        key=(m.get_discourse_position()[0], self.ORDER_SEQ)
+        self.ORDER_SEQ+=1
+        if not self.ORDER_KEYS or key > self.ORDER_KEYS[-1]:
+            self.ORDER_KEYS.append(key)
+            self.ORDERED_MARKABLES.append(m)
+        else:
+            i=bisect_right(self.ORDER_KEYS, key)
+            self.ORDER_KEYS.insert(i, key)
+            self.ORDERED_MARKABLES.insert(i, m)
+        self.MARKABLE2ORDERKEY[m]=key
+
+    def remove_from_order(self, m):
+        key=self.MARKABLE2ORDERKEY.pop(m, None)
+        if key!=None:
+            i=bisect_left(self.ORDER_KEYS, key)
+            del self.ORDER_KEYS[i]
+            del self.ORDERED_MARKABLES[i]
+
     def get_discourse(self):
         return self.DISCOURSE
 
@@ -901,60 +1384,216 @@ class MMAX2MarkableLevel(object):
     # Basedata is required here to correctly expand markable spans (by interpolation)
     # This is the only place where markables are read from xml. 
     # If jpype is available, use attribute name and value normalisation!
-    def load_markables(self, markable_path, basedata, multi_val_exceptions, allow_duplicate_spans=True, verbose=False):
+    # streaming=True uses the lxml iterparse reader, streaming=False the original BeautifulSoup reader.
+    # attributes is an optional list of attribute names to keep, all others are dropped before markable creation.
+    def load_markables(self, markable_path, basedata, multi_val_exceptions, allow_duplicate_spans=True, streaming=True, attributes=None, validate="eager", verbose=False):
         #if verbose: print("Loading markables from", markable_path+self.FILE, file=sys.stderr)
         if verbose: print("Loading markables from", os.path.realpath(markable_path+self.FILE), file=sys.stderr)
+        self.ATTRIBUTE_FILTER=attributes
+        self.SKIPPED=False
+        snapshot_cache, snapshot, snapshot_records = None, None, None
+        if self.get_discourse() and self.get_discourse().get_snapshot_cache():
+            snapshot_cache=self.get_discourse().get_snapshot_cache()
+            # Spans are expanded against the basedata, so snapshots depend on it as well
+            snapshot_sources=self.get_discourse().get_snapshot_sources()+[basedata.FILENAME, markable_path+self.FILE]
+            snapshot=snapshot_cache.get("markables", snapshot_sources)
         try:
-            with codecs.open(markable_path+self.FILE,'r', encoding=self.ENCODING) as ma_in:
-                soup=bs(ma_in.read(), 'lxml')
-                #self.NAMESPACE='xmlns="'+soup.find("markables")['xmlns']+'"'
-                # This would give preference to the ns in the markable file ...
-                # Use supplied ns only if none was contained in common_paths file at level creation time
+            if snapshot!=None:
+                # The snapshot contains (attribute dict as read from the xml file w/o span, expanded spanlists) records
+                namespace, self.DTD_PATH, records = snapshot
                 if not self.NAMESPACE:
-                    self.NAMESPACE=soup.find("markables")['xmlns']
-
-                dtype=[item for item in soup.contents]
-                self.DTD_PATH=dtype[1].split(" ")[2]
-                # Go over all markables in xml file
-                for m in soup.find_all("markable"):
-                    # Get all attributes from xml, and make copy because dict will be modified in what follows.
-                    attrs=m.attrs.copy()
-                    if self.get_J_MMAX2ATTRIBUTEPANEL():
-                        self.normalize_attributes(attrs)
-                    try:
-                        # This is a meta attribute not stored in the attributes dict
-                        # It might be missing if the markables were created outside MMAX2, but will be added upon the next save
-                        attrs.pop('mmax_level')
-                    except KeyError:
-                        pass
-                    # Dito.
+                    self.NAMESPACE=namespace
+                markable_records=((attrs.copy(), spanlists) for (attrs, spanlists) in records)
+            elif streaming:
+                markable_records=((attrs, None) for attrs in self.read_markables_streaming(markable_path+self.FILE))
+            else:
+                markable_records=((attrs, None) for attrs in self.read_markables_soup(markable_path+self.FILE))
+            if snapshot_cache and snapshot==None:
+                # Collect records for a new snapshot
+                snapshot_records=[]
+            # Go over all markables in xml file
+            for (attrs, spanlists) in markable_records:
+                if spanlists==None:
                     # Expand short span from xml file *once*, and assign at markable creation
                     spanlists=self.get_discourse().span_to_spanlists(attrs.pop('span'))
-                    # Make sure to add the markable from file with the same id, such that pointers are not broken
-                    id_from_file=attrs.pop('id')
-                    # newly_added is True if new_m has been newly added
-                    # Add markable, w/o any attributes yet!
-                    # This will fail if the span is empty, or if allow_duplicate_spans=False and a markable with the same span exists already.
-                    (newly_added, new_m) = self.add_markable(spanlists, m_id=id_from_file, verbose=verbose, allow_duplicate_spans=allow_duplicate_spans, allow_overlap=True)
-                    if newly_added:
-                        try:
-                            # This is the only point where this exception is raised
+                if snapshot_records!=None:
+                    snapshot_records.append((attrs.copy(), spanlists))
+                if self.get_J_MMAX2ATTRIBUTEPANEL() or self.ANNOTATION_SCHEME:
+                    self.normalize_attributes(attrs)
+                try:
+                    # This is a meta attribute not stored in the attributes dict
+                    # It might be missing if the markables were created outside MMAX2, but will be added upon the next save
+                    attrs.pop('mmax_level')
+                except KeyError:
+                    pass
+                # Make sure to add the markable from file with the same id, such that pointers are not broken
+                id_from_file=attrs.pop('id')
+                # All attributes as read, as context for validating the requested ones
+                all_attrs=attrs
+                if attributes!=None:
+                    attrs={k:v for (k,v) in attrs.items() if k in attributes}
+                # newly_added is True if new_m has been newly added
+                # Add markable, w/o any attributes yet!
+                # This will fail if the span is empty, or if allow_duplicate_spans=False and a markable with the same span exists already.
+                (newly_added, new_m) = self.add_markable(spanlists, m_id=id_from_file, verbose=verbose, allow_duplicate_spans=allow_duplicate_spans, allow_overlap=True)
+                if newly_added and validate=="eager":
+                    try:
+                        # This is the only point where this exception is raised
+                        if attributes==None:
                             new_m.update_attributes(attrs, verbose=verbose)
-                        except InvalidMMAX2AttributeException as exc:
-                            # exc contains all the details for each individual exception
-                            multi_val_exceptions.add(exc)
+                        else:
+                            # Validate with all attributes (since requested ones might depend on others), 
+                            # but neither add defaults for nor report errors in attributes that were not requested
+                            new_m.set_validated_attributes(attrs, self.restrict_validation_result(self.validate(all_attrs.copy()), attributes))
+                    except InvalidMMAX2AttributeException as exc:
+                        # exc contains all the details for each individual exception
+                        multi_val_exceptions.add(exc)
+                elif newly_added:
+                    # Attributes as read from file, see MMAX2Discourse.load_markables()
+                    new_m.ATTRIBUTES=attrs
+                    self.index_attributes(new_m)
+                    if validate=="deferred":
+                        # Keep all attributes as read until validation, since the filtered ones might depend on others
+                        self.UNVALIDATED[new_m]=all_attrs if attributes!=None else None
+            if snapshot_records!=None:
+                snapshot_cache.put("markables", snapshot_sources, (self.NAMESPACE, self.DTD_PATH, snapshot_records))
             if verbose: print("\tLoaded",len(self.MARKABLES),"markables to level",self.NAME, file=sys.stderr)       
         except FileNotFoundError:
             #if verbose: print("Markables at "+markable_path+self.FILE +" not found, skipping!", file=sys.stderr)
             if verbose: print("Markables at "+os.path.realpath(markable_path+self.FILE) +" not found, skipping!", file=sys.stderr)
             pass
 
+    # Returns the result of validate() with supplied, valid, invalid and missing restricted to attribute names in attributes
+    def restrict_validation_result(self, result, attributes):
+        _, supplied, valid, invalid, missing = result
+        supplied, valid, invalid, missing = [{k:v for (k,v) in d.items() if str(k) in attributes} for d in (supplied, valid, invalid, missing)]
+        return len(invalid)>0 or len(missing)>0, supplied, valid, invalid, missing
+
+    # Yields a fresh attribute dict (incl. id, span, mmax_level) for every markable in markable_file.
+    def read_markables_soup(self, markable_file):
+        with codecs.open(markable_file,'r', encoding=self.ENCODING) as ma_in:
+            soup=bs(ma_in.read(), 'lxml')
+        #self.NAMESPACE='xmlns="'+soup.find("markables")['xmlns']+'"'
+        # This would give preference to the ns in the markable file ...
+        # Use supplied ns only if none was contained in common_paths file at level creation time
+        if not self.NAMESPACE:
+            self.NAMESPACE=soup.find("markables")['xmlns']
+
+        dtype=[item for item in soup.contents]
+        self.DTD_PATH=dtype[1].split(" ")[2]
+        for m in soup.find_all("markable"):
+            # Make copy because dict will be modified by the caller.
+            yield m.attrs.copy()
+
+    # Same as read_markables_soup, but streams <markable> elements with lxml iterparse.
+    # Namespace and DTD path are taken from the parser events, and processed elements are
+    # cleared right away, so memory use does not grow with the file size.
+    # Files with non-XML entities (see has_non_xml_entities()) are read with read_markables_soup() instead, and if the file
+    # turns out not to be well-formed XML, the markables after the ones already yielded are taken from read_markables_soup().
+    def read_markables_streaming(self, markable_file):
+        # Raise FileNotFoundError here, before iterparse gets to see the file
+        if has_non_xml_entities(markable_file):
+            yield from self.read_markables_soup(markable_file)
+            return
+        yielded=0
+        try:
+            with open(markable_file,'rb') as ma_in:
+                for event, item in etree.iterparse(ma_in, events=("start-ns", "start", "end"), resolve_entities=False, huge_tree=True):
+                    if event=="start-ns":
+                        # item is a (prefix, uri) tuple. 
+                        # Use supplied ns only if none was contained in common_paths file at level creation time
+                        if item[0]=="" and not self.NAMESPACE:
+                            self.NAMESPACE=item[1]
+                    elif event=="start":
+                        if item.getparent() is None:
+                            # Root element: the doctype is known now
+                            system_url=item.getroottree().docinfo.system_url
+                            if system_url:
+                                self.DTD_PATH='"'+system_url+'"'
+                    # Element names in any case, like the soup reader
+                    elif etree.QName(item).localname.lower()=="markable":
+                        # The soup reader sees lower-cased attribute names only.
+                        # Intern names, so markables do not hold their own copies.
+                        yield {sys.intern(k.lower()):v for (k,v) in item.attrib.items()}
+                        yielded+=1
+                        # Free the current element and all already processed siblings
+                        item.clear()
+                        while item.getprevious() is not None:
+                            del item.getparent()[0]
+        except etree.XMLSyntaxError:
+            for (i, attrs) in enumerate(self.read_markables_soup(markable_file)):
+                if i>=yielded:
+                    yield attrs
+
+    # Record the markable path only, and defer load_markables() until load_pending_markables() is called.
+    def set_pending_load(self, markable_path, allow_duplicate_spans=True, attributes=None, validate="eager"):
+        self.PENDING_LOAD=(markable_path, allow_duplicate_spans, attributes, validate)
+        self.SKIPPED=False
+
+    def is_loaded(self):
+        return self.PENDING_LOAD==None
+
+    def set_skipped(self):
+        self.SKIPPED=True
+
+    # Returns None if this level holds all markables and attributes from its file, or the reason why it does not
+    def get_incompleteness(self):
+        if self.SKIPPED:
+            return "the level was not loaded"
+        if self.PENDING_LOAD!=None:
+            return "the level has not been loaded yet"
+        if self.ATTRIBUTE_FILTER!=None:
+            return "only attributes "+str(list(self.ATTRIBUTE_FILTER))+" were loaded"
+        return None
+
+    def is_complete(self):
+        return self.get_incompleteness()==None
+
+    # Load markables if loading has been deferred, and raise validation exceptions (if any) like 
+    # MMAX2Discourse.load_markables() does. The level counts as loaded even if an exception is raised.
+    def load_pending_markables(self, verbose=False):
+        if self.PENDING_LOAD==None:
+            return
+        markable_path, allow_duplicate_spans, attributes, validate = self.PENDING_LOAD
+        self.PENDING_LOAD=None
+        self.get_discourse().get_commonpaths().init_annotation_scheme(self, self.get_discourse().get_mmax2_project(), verbose=verbose)
+        multi_val_exceptions=MultipleInvalidMMAX2AttributeExceptions()
+        self.load_markables(markable_path, self.get_discourse().get_basedata(), multi_val_exceptions, allow_duplicate_spans=allow_duplicate_spans, 
+            streaming=self.get_discourse().get_streaming(), attributes=attributes, validate=validate, verbose=verbose)
+        if multi_val_exceptions.get_exception_count()>0:
+            raise multi_val_exceptions
+
     def get_name(self):
         return self.NAME
 
     def get_scheme(self):
         return self.SCHEME
 
+    def set_scheme(self, scheme):
+        self.SCHEME=scheme
+        self.clear_scheme_caches()
+
+    def get_annotation_scheme(self):
+        return self.ANNOTATION_SCHEME
+
+    def set_annotation_scheme(self, annotation_scheme):
+        self.ANNOTATION_SCHEME=annotation_scheme
+        self.SCHEME_TABLE=annotation_scheme.get_table() if annotation_scheme!=None else None
+        self.clear_scheme_caches()
+
+    # This must be called whenever the annotation scheme of this level changes
+    def clear_scheme_caches(self):
+        self.clear_validation_cache()
+        self.DEFAULT_ATTRIBUTES=None
+        self.NORMALIZED_NAMES={}
+
+    def clear_validation_cache(self):
+        self.VALIDATION_CACHE={}
+
+    # Returns (hits, misses, current size)
+    def get_validation_cache_info(self):
+        return (self.VALIDATION_CACHE_HITS, self.VALIDATION_CACHE_MISSES, len(self.VALIDATION_CACHE))
+
     def get_customization(self):
         return self.CUSTOMIZATION
     
@@ -968,6 +1607,12 @@ class MMAX2MarkableLevel(object):
             r = self.BASEDATA2MARKABLELISTS[bdid]
         except KeyError:
             r = []
+        if self.COMPACT_COUNT>0:
+            pos=self.get_discourse().get_basedata().BDID2LISTPOS.get(bdid,None)
+            compact=[m for m in self.SPAN_INDEX.get_overlapping(pos, pos) if isinstance(m, CompactMMAX2Markable)] if pos!=None else []
+            if len(compact)>0:
+                # Creation order, like in BASEDATA2MARKABLELISTS
+                r=sorted(r+compact, key=lambda m: self.MARKABLE2ORDERKEY[m][1])
         if with_attributes:
             for m in r:
                 if m.matches_all(with_attributes):
@@ -1001,9 +1646,18 @@ class MMAX2MarkableLevel(object):
         if len(self.MARKABLES)>0:
             print("Removing %s markables from level %s"%(str(len(self.MARKABLES)),self.NAME), file=sys.stderr)
             self.MARKABLES=list()
+            self.ORDERED_MARKABLES=list()
+            self.ORDER_KEYS=list()
+            self.MARKABLE2ORDERKEY={}
+            self.SPAN_INDEX=MMAX2SpanIndex()
+            self.SPAN2MARKABLES={}
             self.BASEDATA2MARKABLELISTS={}
+            self.COMPACT_COUNT=0
             self.MAX_ID=0
             self.ID2MARKABLE={}
+            self.UNVALIDATED={}
+            if self.ATTRIBUTE_INDEX!=None:
+                self.ATTRIBUTE_INDEX={}
         # Why retutn self?
         return self
 
@@ -1012,22 +1666,83 @@ class MMAX2MarkableLevel(object):
 
     def delete_markable(self, deletee):
         # Go over all BD elements that deletee spans
-        for bd in flatten_spanlists(deletee.get_spanlists()):
-            try:
-                self.BASEDATA2MARKABLELISTS[bd].remove(deletee)
-            except ValueError:
-                pass
+        if not isinstance(deletee, CompactMMAX2Markable):
+            for bd in flatten_spanlists(deletee.get_spanlists()):
+                try:
+                    self.BASEDATA2MARKABLELISTS[bd].remove(deletee)
+                except ValueError:
+                    pass
         self.MARKABLES.remove(deletee)
+        if isinstance(deletee, CompactMMAX2Markable):
+            self.COMPACT_COUNT-=1
+        # Use the ranges deletee was registered with
+        span_key=self.get_span_key(deletee.get_spanlists(), self.SPAN_INDEX.get_ranges(deletee) or None)
+        same_span=self.SPAN2MARKABLES.get(span_key,[])
+        for (i, m) in enumerate(same_span):
+            if m is deletee:
+                del same_span[i]
+                break
+        if len(same_span)==0:
+            self.SPAN2MARKABLES.pop(span_key, None)
+        self.unindex_attributes(deletee)
+        self.UNVALIDATED.pop(deletee, None)
+        self.remove_from_order(deletee)
+        self.SPAN_INDEX.remove(deletee)
+
+    # Markables loaded with validate="deferred" that have not been validated since, in load order
+    def get_unvalidated_markables(self):
+        return list(self.UNVALIDATED)
+
+    # Validates the attributes of markables (default: all markables on this level) in one batch, like update_attributes() 
+    # would do for each, incl. adding missing attributes if add_missing=True. 
+    # Returns multi_val_exceptions (a new MultipleInvalidMMAX2AttributeExceptions if None is supplied), 
+    # with one InvalidMMAX2AttributeException per invalid markable, in the order of markables.
+    # validate() caches its result for each distinct attribute dict (see VALIDATION_CACHE), so with the Java binding, 
+    # the number of calls to the attribute panel depends on the number of distinct attribute dicts, not on the number of markables.
+    def validate_markables(self, markables=None, multi_val_exceptions=None, add_missing=True, verbose=False):
+        if multi_val_exceptions==None:
+            multi_val_exceptions=MultipleInvalidMMAX2AttributeExceptions()
+        if markables==None:
+            markables=list(self.MARKABLES)
+        exception_count, misses=multi_val_exceptions.get_exception_count(), self.VALIDATION_CACHE_MISSES
+        for m in markables:
+            # For markables loaded with an attribute filter and validate="deferred", validate all attributes as read, like "eager" does
+            supplied=self.UNVALIDATED.get(m,None)
+            if supplied==None:
+                supplied=m.get_attributes()
+            validation_result=self.validate(supplied.copy())
+            if self.ATTRIBUTE_FILTER!=None:
+                validation_result=self.restrict_validation_result(validation_result, self.ATTRIBUTE_FILTER)
+            validation_errors, _, valid, invalid, missing = validation_result
+            ea=m.get_attributes().copy()
+            try:
+                # Each exception gets its own dicts
+                m.set_validated_attributes(ea, (validation_errors, ea.copy(), valid, invalid, missing), add_missing=add_missing)
+            except InvalidMMAX2AttributeException as exc:
+                multi_val_exceptions.add(exc)
+        if verbose: print("Validated "+str(len(markables))+" markables ("+str(self.VALIDATION_CACHE_MISSES-misses)+" validation cache misses) on level "+self.NAME+", "+
+                          str(multi_val_exceptions.get_exception_count()-exception_count)+" invalid", file=sys.stderr)
+        return multi_val_exceptions
 
     def get_markables_by_attributes(self, attrs, join="all"):
         res = []
         if join =="all":
-            for m in self.MARKABLES:
+            candidates=self.MARKABLES
+            if self.ATTRIBUTE_INDEX!=None:
+                # Only plain values can be looked up, regexp values and _string are checked by matches_all() below
+                plain=[(k,v) for (k,v) in attrs.items() if k!='_string' and not v.startswith("***")]
+                if len(plain)>0:
+                    # Start with the rarest value
+                    k,v=min(plain, key=lambda kv: len(self.ATTRIBUTE_INDEX.get(kv[0],{}).get(str(kv[1]),())))
+                    candidates=self.get_indexed_markables(k,v)
+            for m in candidates:
                 if m.matches_all(attrs):
                     res.append(m)
         return res
 
     def get_markables_by_attribute_value(self, att, val):
+        if self.ATTRIBUTE_INDEX!=None:
+            return self.get_indexed_markables(att, val)
         res = []
         for m in self.MARKABLES:
             if m.get_attributes().get(att,None)==val:
@@ -1038,6 +1753,9 @@ class MMAX2MarkableLevel(object):
         return self.get_markables_by_attribute_value(att, val)
 
     def remove_markables_by_value(self, att, val, save_if_modified=False, preserve=True):
+        if save_if_modified and not self.is_complete():
+            # Fail before anything is removed
+            raise IncompleteMarkableLevelException(self.NAME, self.get_incompleteness())
         removed=0
         to_del = self.get_markables_by_value(att, val)
         for d in to_del:
@@ -1051,6 +1769,9 @@ class MMAX2MarkableLevel(object):
 
 
     def get_markable_by_unique_attribute_value(self, att, val):
+        if self.ATTRIBUTE_INDEX!=None:
+            ms=self.ATTRIBUTE_INDEX.get(att,{}).get(str(val),())
+            return min(ms, key=lambda m: self.MARKABLE2ORDERKEY[m][1]) if len(ms)>0 else None
         for m in self.MARKABLES:
             if m.get_attributes().get(att,None)==val:
                 return m
@@ -1068,7 +1789,40 @@ class MMAX2MarkableLevel(object):
 
     def get_markables(self):
         #return self.MARKABLES
-        return [l[0] for l in sorted([(m, m.get_discourse_position()[0]) for m in self.MARKABLES], key=itemgetter(1))]
+        #return [l[0] for l in sorted([(m, m.get_discourse_position()[0]) for m in self.MARKABLES], key=itemgetter(1))]
+        # Markables are kept in discourse order, so no sorting is required
+        return list(self.ORDERED_MARKABLES)
+
+    # Yield markables in discourse order whose start position is between first_pos and last_pos (incl.)
+    def iter_markables_starting_between(self, first_pos, last_pos):
+        for i in range(bisect_left(self.ORDER_KEYS, (first_pos,)), bisect_left(self.ORDER_KEYS, (last_pos+1,))):
+            yield self.ORDERED_MARKABLES[i]
+
+    def get_markables_starting_between(self, first_pos, last_pos):
+        return list(self.iter_markables_starting_between(first_pos, last_pos))
+
+    # The following use SPAN_INDEX, and return markables in discourse order. 
+    # Positions are basedata list positions, and last_pos is inclusive.
+
+    # Markables with at least one fragment that overlaps first_pos..last_pos
+    def get_markables_overlapping(self, first_pos, last_pos):
+        return self.SPAN_INDEX.get_overlapping(first_pos, last_pos)
+
+    # Markables with one fragment that covers all of first_pos..last_pos
+    def get_markables_containing(self, first_pos, last_pos):
+        return self.SPAN_INDEX.get_containing(first_pos, last_pos)
+
+    # Markables that lie completely inside first_pos..last_pos
+    def get_markables_contained_in(self, first_pos, last_pos):
+        return self.SPAN_INDEX.get_contained_in(first_pos, last_pos)
+
+    # Returns (distance, markable) for the markable closest to first_pos..last_pos, where distance is the 
+    # number of positions between them (0 if they overlap). Returns (None, None) for an empty level.
+    # Use exclude (e.g. [m]) to skip markables.
+    def get_nearest_markable(self, first_pos, last_pos=None, exclude=None):
+        if last_pos==None:
+            last_pos=first_pos
+        return self.SPAN_INDEX.get_nearest(first_pos, last_pos, exclude=set(exclude) if exclude else ())
 
     def is_empty(self):
         return len(self.MARKABLES)==0
@@ -1083,6 +1837,283 @@ class MMAX2MarkableLevel(object):
         return len(self.MARKABLES)
 
 
+######################################################################
+class MMAX2AnnotationScheme(object):                                 #
+# Pure-Python reader for MMAX2 *_scheme.xml files. Supports          #
+# validation, default attributes and attribute name normalization    #
+# without the Java MMAX2 libraries, following the same algorithm as  #
+# MMAX2MarkableLevel.validate() does with the Java attribute panel.  #
+######################################################################
+    def __init__(self, file, verbose=False):
+        self.FILE               = file
+        # All attributes in file order
+        self.ATTRIBUTES         = []
+        self.ID2ATTRIBUTE       = {}
+        self.LCNAME2ATTRIBUTE   = {}
+        # Attributes that are not the 'next' attribute of any value, i.e. the ones shown initially
+        self.INDEPENDENT        = []
+        # MMAX2SchemeTable, see get_table()
+        self.TABLE              = None
+        self.read(verbose=verbose)
+
+    def __repr__(self):
+        return "MMAX2AnnotationScheme "+self.FILE+" with "+str(len(self.ATTRIBUTES))+" attributes."
+
+    def read(self, verbose=False):
+        if verbose: print("Reading annotation scheme from", os.path.realpath(self.FILE), file=sys.stderr)
+        tree=etree.parse(self.FILE, etree.XMLParser(load_dtd=False, no_network=True, resolve_entities=False))
+        for a in tree.getroot().iter('{*}attribute'):
+            atts={k.lower():v for (k,v) in a.attrib.items()}
+            att=MMAX2SchemeAttribute(self, atts.get('id',''), atts.get('name',''), atts.get('type','nominal_list'), 
+                                     max_size=atts.get('max_size','-1'), target_domain=atts.get('target_domain',''))
+            for v in a.iter('{*}value'):
+                vatts={k.lower():x for (k,x) in v.attrib.items()}
+                att.add_value(vatts.get('name',''), [n.strip() for n in re.split('[,;]', vatts.get('next','')) if n.strip()!=""])
+            self.ATTRIBUTES.append(att)
+            self.ID2ATTRIBUTE[att.get_id()]=att
+            self.LCNAME2ATTRIBUTE[att.get_lowercased_name()]=att
+        dependent=set(n for att in self.ATTRIBUTES for ns in att.NEXT.values() for n in ns)
+        self.INDEPENDENT=[att for att in self.ATTRIBUTES if att.get_id() not in dependent]
+        if verbose: print("\t"+str(len(self.ATTRIBUTES))+" attributes, "+str(len(self.INDEPENDENT))+" independent", file=sys.stderr)
+
+    def get_file(self):
+        return self.FILE
+
+    def get_attributes(self):
+        return self.ATTRIBUTES
+
+    def get_independent_attributes(self):
+        return self.INDEPENDENT
+
+    def get_attribute_by_id(self, att_id):
+        return self.ID2ATTRIBUTE.get(att_id,None)
+
+    # Case-insensitive
+    def get_attribute_by_name(self, name):
+        return self.LCNAME2ATTRIBUTE.get(str(name).lower(),None)
+
+    # Returns the lower-cased name of the scheme attribute matching name, or name if there is none.
+    # This is meant to do what MMAX2AttributePanel.normalizeAttributeName() does in the Java MMAX2 libraries, but it has not been 
+    # checked against their source. check_scheme_conformance.py compares both for the attribute names of a corpus.
+    def normalize_attribute_name(self, name):
+        att=self.get_attribute_by_name(name)
+        return att.get_lowercased_name() if att!=None else name
+
+    # Returns the MMAX2SchemeTable for this scheme, which is compiled on first access
+    def get_table(self):
+        if self.TABLE==None:
+            self.TABLE=MMAX2SchemeTable(self)
+        return self.TABLE
+
+    # Same as MMAX2MarkableLevel.validate(): Returns validation_errors, supplied, valid, invalid, missing
+    def validate(self, supplied):
+        return self.get_table().validate(supplied)
+
+    # Same as MMAX2MarkableLevel.get_default_attributes(): Returns the list of (type, name, default value, branching)
+    # and the dict of name: default value for all attributes that are active if every attribute has its default value.
+    def get_default_attributes(self):
+        return self.get_table().get_default_attributes()
+
+
+######################################################################
+class MMAX2SchemeTable(object):                                      #
+# Decision table compiled from an MMAX2AnnotationScheme. Attributes  #
+# are numbered, and each one is a tuple of display name, lower-cased #
+# name, type, default value, allowed values (None if any value is    #
+# allowed), value -> numbers of dependent attributes (or one tuple   #
+# of those for non-nominal attributes), and pointer max size.        #
+# Validation then only needs dict and set lookups.                   #
+######################################################################
+    def __init__(self, scheme):
+        self.FILE           = scheme.get_file()
+        atts                = scheme.get_attributes()
+        att2num             = {a:i for (i,a) in enumerate(atts)}
+        self.ATTRIBUTES     = []
+        for a in atts:
+            if a.is_nominal():
+                allowed=frozenset(a.get_values())
+                nxt={v:tuple(att2num[d] for d in a.get_next_attributes(v)) for v in a.get_values()}
+            else:
+                allowed=None
+                nxt=tuple(att2num[d] for d in a.get_next_attributes(None))
+            self.ATTRIBUTES.append((a.get_display_name(), a.get_lowercased_name(), a.get_type(), a.get_default_value(), allowed, nxt, a.get_max_size()))
+        self.INDEPENDENT    = tuple(att2num[a] for a in scheme.get_independent_attributes())
+        # Default attributes, with dependents of default values
+        self.DEFAULT_LIST   = []
+        self.DEFAULT_DICT   = {}
+        current=list(self.INDEPENDENT)
+        active=set(current)
+        ai=0
+        while ai < len(current):
+            name, _, att_type, default, allowed, nxt, _ = self.ATTRIBUTES[current[ai]]
+            self.DEFAULT_LIST.append((att_type, name, default, len(nxt)>0 if allowed==None else any(len(n)>0 for n in nxt.values())))
+            self.DEFAULT_DICT[name]=default
+            for dep in (nxt if allowed==None else nxt.get(default,())):
+                if dep not in active:
+                    active.add(dep)
+                    current.append(dep)
+            ai+=1
+
+    def __repr__(self):
+        return "MMAX2SchemeTable "+self.FILE+" with "+str(len(self.ATTRIBUTES))+" attributes."
+
+    # Returns copies, since callers might use the dict as markable attributes
+    def get_default_attributes(self):
+        return list(self.DEFAULT_LIST), dict(self.DEFAULT_DICT)
+
+    # Same algorithm as the Java-based MMAX2MarkableLevel.validate()
+    def validate(self, supplied):
+        validation_errors=False
+        invalid     = supplied.copy()
+        consumed    = []
+        valid       = {}
+        missing     = {}
+        # Supplied attribute names are compared lower-cased
+        lc2keys={}
+        for k in supplied:
+            lc2keys.setdefault(str(k).lower(),[]).append(k)
+        current=list(self.INDEPENDENT)
+        active=set(current)
+        ai=0
+        # Until all attributes have been processed, including dependent ones
+        while ai < len(current):
+            name, lcn, att_type, default, allowed, nxt, max_size = self.ATTRIBUTES[current[ai]]
+            catt_keys=lc2keys.get(lcn,None)
+            if catt_keys==None:
+                missing[name]=default
+            else:
+                for catt_key in catt_keys:
+                    value=supplied[catt_key]
+                    selected=default
+                    if allowed!=None and value not in allowed:
+                        # The supplied attribute exists, but has an invalid value, and will not be consumed
+                        validation_errors=True
+                    else:
+                        selected=value
+                        if att_type==MARKABLE_POINTER and max_size!=-1 and max_size < len(value.split(";")):
+                            validation_errors=True
+                            print("Pointer length overrun")
+                        else:
+                            consumed.append(catt_key)
+                            valid[catt_key]=value
+                    # Dependent attributes for the (valid or default) value become active
+                    for dep in (nxt if allowed==None else nxt.get(selected,())):
+                        if dep not in active:
+                            active.add(dep)
+                            current.append(dep)
+            ai+=1
+        for i in consumed:
+            invalid.pop(i,None)
+        # Extra attributes which could not be consumed also trigger a validation exception, just like missing ones
+        if len(invalid)>0 or len(missing)>0:    validation_errors=True
+        return validation_errors, supplied, valid, invalid, missing
+
+
+# Returns the MMAX2AnnotationScheme for scheme_file. Schemes are shared by all discourses in this process 
+# (and their tables compiled only once), as long as the file does not change.
+def get_shared_annotation_scheme(scheme_file, verbose=False):
+    scheme, cached=get_cached_for_file(ANNOTATION_SCHEME_CACHE, ANNOTATION_SCHEME_CACHE_MAX_SIZE, scheme_file, 
+                                       lambda: MMAX2AnnotationScheme(scheme_file, verbose=verbose))
+    if cached and verbose: print("Using shared annotation scheme "+str(os.path.realpath(scheme_file)), file=sys.stderr)
+    return scheme
+
+# Returns (value, True) if cache (an OrderedDict) has a value for the real path of file, and file has not changed since 
+# (by mtime and size), and (make(), False) otherwise. The value from make() replaces an outdated one, and the 
+# least recently used files are dropped from cache if it has more than max_size entries.
+def get_cached_for_file(cache, max_size, file, make):
+    st=os.stat(file)
+    path, stamp=os.path.realpath(file), (st.st_mtime_ns, st.st_size)
+    entry=cache.get(path,None)
+    if entry!=None and entry[0]==stamp:
+        cache.move_to_end(path)
+        return entry[1], True
+    value=make()
+    cache[path]=(stamp, value)
+    cache.move_to_end(path)
+    while len(cache)>max_size:
+        cache.popitem(last=False)
+    return value, False
+
+#####################################################################
+class MMAX2SchemeAttribute(object):                                 #
+# One <attribute> of an MMAX2AnnotationScheme, with its values and  #
+# the ids of the attributes that each value activates ('next').     #
+#####################################################################
+    TYPES = {'nominal_button':NOMINAL_BUTTON, 'nominal_list':NOMINAL_LIST, 'freetext':FREETEXT, 
+             'markable_set':MARKABLE_SET, 'markable_pointer':MARKABLE_POINTER}
+
+    def __init__(self, scheme, att_id, name, att_type, max_size='-1', target_domain=''):
+        self.SCHEME         = scheme
+        self.ID             = att_id
+        self.NAME           = name
+        try:
+            self.TYPE       = self.TYPES[att_type.lower()]
+        except KeyError:
+            print("Unknown attribute type "+att_type+" for attribute "+name+", using freetext!", file=sys.stderr)
+            self.TYPE       = FREETEXT
+        try:
+            self.MAX_SIZE   = int(max_size)
+        except ValueError:
+            self.MAX_SIZE   = -1
+        self.TARGET_DOMAIN  = target_domain
+        # Value names in file order. Only nominal attributes restrict their values to these.
+        self.VALUES         = []
+        # Value name -> list of ids of dependent attributes
+        self.NEXT           = OrderedDict()
+
+    def add_value(self, name, next_ids):
+        self.VALUES.append(name)
+        self.NEXT[name]=next_ids
+
+    def get_id(self):
+        return self.ID
+
+    def get_display_name(self):
+        return self.NAME
+
+    def get_lowercased_name(self):
+        return self.NAME.lower()
+
+    def get_type(self):
+        return self.TYPE
+
+    def get_max_size(self):
+        return self.MAX_SIZE
+
+    def get_target_domain(self):
+        return self.TARGET_DOMAIN
+
+    def get_values(self):
+        return self.VALUES
+
+    def is_nominal(self):
+        return self.TYPE in (NOMINAL_BUTTON, NOMINAL_LIST)
+
+    # Nominal attributes default to their first value, relations to 'empty', and freetext to ''
+    def get_default_value(self):
+        if self.is_nominal():
+            return self.VALUES[0] if len(self.VALUES)>0 else ""
+        if self.TYPE in (MARKABLE_SET, MARKABLE_POINTER):
+            return "empty"
+        return ""
+
+    def is_valid_value(self, value):
+        if self.is_nominal():
+            return value in self.NEXT
+        return True
+
+    def get_is_branching(self):
+        return any(len(n)>0 for n in self.NEXT.values())
+
+    # Returns the attributes activated by value. For non-nominal attributes, these do not depend on the value.
+    def get_next_attributes(self, value):
+        if self.is_nominal():
+            ids=self.NEXT.get(value,[])
+        else:
+            ids=[n for ns in self.NEXT.values() for n in ns]
+        return [self.SCHEME.get_attribute_by_id(i) for i in ids if self.SCHEME.get_attribute_by_id(i)!=None]
+
+
 ###################################################################
 class MMAX2Project(object):                                       #
 # Light-weight class for handling the diverse MMAX2 project files #
@@ -1141,11 +2172,19 @@ class MMAX2Project(object):                                       #
             except IndexError:
                 self.KEYACTIONS_FILE=""
 
-    def load_basedata(self, commonpaths, verbose=False):
+    def load_basedata(self, commonpaths, snapshot_cache=None, columnar=False, streaming=True, verbose=False):
         for (k,v) in [(k,v) for (k,v) in self.BASEDATA.items() if v != ""]:
             #if verbose: print("Loading basedata from "+self.get_mmax2_path()+commonpaths.get_basedata_path()+v, file=sys.stderr)
             if verbose: print("Loading basedata from "+os.path.realpath(self.get_mmax2_path()+commonpaths.get_basedata_path()+v), file=sys.stderr)
-            self.BASEDATA[k]=Basedata(self.get_mmax2_path()+"/"+commonpaths.get_basedata_path()+v, verbose=verbose)
+            bd_file=self.get_mmax2_path()+"/"+commonpaths.get_basedata_path()+v
+            if snapshot_cache:
+                snapshot_sources=[self.FILE, commonpaths.FILE, bd_file]
+                snapshot=snapshot_cache.get("basedata", snapshot_sources)
+                self.BASEDATA[k]=Basedata(bd_file, snapshot=snapshot, columnar=columnar, streaming=streaming, verbose=verbose)
+                if snapshot==None and os.path.exists(bd_file):
+                    snapshot_cache.put("basedata", snapshot_sources, self.BASEDATA[k].get_snapshot())
+            else:
+                self.BASEDATA[k]=Basedata(bd_file, columnar=columnar, streaming=streaming, verbose=verbose)
         return len(self.BASEDATA[k].get_elements())
 
     def get_mmax2_path(self, full=False):
@@ -1157,7 +2196,78 @@ class MMAX2Project(object):                                       #
     def get_basedata_path(self):
         return 
 
+#############################################################
+class MMAX2SnapshotCache(object):                           #
+# Directory of pickled snapshots of parsed basedata and     #
+# markable files. Each entry is keyed by the paths of its   #
+# source files, and is stale once any of these has changed  #
+# in mtime or size.                                         #
+#############################################################
+    # Bump this when the structure of the stored data changes
+    VERSION = 2
+
+    def __init__(self, cache_dir, verbose=False):
+        self.CACHE_DIR  = cache_dir
+        self.VERBOSE    = verbose
+        if os.path.isdir(self.CACHE_DIR)==False:
+            os.makedirs(self.CACHE_DIR)
+
+    def get_cache_dir(self):
+        return self.CACHE_DIR
+
+    def get_entry_file(self, kind, sources):
+        key=hashlib.sha1((kind+"\n"+"\n".join([os.path.realpath(s) for s in sources])).encode("utf-8")).hexdigest()
+        return os.path.join(self.CACHE_DIR, key+".snapshot")
+
+    # Returns None if any of the sources does not exist
+    def get_signature(self, sources):
+        sig=[self.VERSION]
+        for s in sources:
+            try:
+                st=os.stat(s)
+            except FileNotFoundError:
+                return None
+            sig.append((os.path.realpath(s), st.st_mtime_ns, st.st_size))
+        return sig
+
+    # Returns the stored data, or None if no entry exists or the entry is stale
+    def get(self, kind, sources):
+        sig=self.get_signature(sources)
+        if sig==None:
+            return None
+        try:
+            with open(self.get_entry_file(kind, sources), "rb") as sin:
+                stored_sig, data = pickle.load(sin)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            # Unreadable entries are treated like stale ones and will be rebuilt
+            if self.VERBOSE: print("Could not read snapshot for "+str(sources[-1])+": "+str(ex), file=sys.stderr)
+            return None
+        if stored_sig!=sig:
+            if self.VERBOSE: print("Snapshot for "+str(sources[-1])+" is stale", file=sys.stderr)
+            return None
+        if self.VERBOSE: print("Using snapshot for "+str(sources[-1]), file=sys.stderr)
+        return data
+
+    def put(self, kind, sources, data):
+        sig=self.get_signature(sources)
+        if sig==None:
+            return
+        entry_file=self.get_entry_file(kind, sources)
+        # Write to tmp file first, so concurrent readers never see partial entries
+        tmp_file=entry_file+"."+str(os.getpid())+".tmp"
+        with open(tmp_file, "wb") as sout:
+            pickle.dump((sig, data), sout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, entry_file)
+        if self.VERBOSE: print("Wrote snapshot for "+str(sources[-1])+" to "+entry_file, file=sys.stderr)
+
+
 class MMAX2Markable(object):
+    # Slots, since levels can have very many markables. __dict__ (which is only created when other attributes are set)
+    # and __weakref__ are kept, so that markables can still be given custom attributes and be weakly referenced.
+    __slots__ = ('LEVEL', 'SPANLISTS', 'ID', 'ATTRIBUTES', 'DISC_POS', 'POINTS_TO', '__dict__', '__weakref__')
+
     # Constructor does not have an attributes parameter. Attributes *must* be set using set_attributes(), which will *always* involve validation.   
     def __init__(self, spanlists, level, m_id="", verbose=False):
         self.LEVEL      = level         # This might contain a connection to the underlying MMAX2AnnotationScheme instance 
@@ -1228,7 +2338,7 @@ class MMAX2Markable(object):
         else:                       targetlevel_name=targetlevel_name+":"
 
         # This duplicates the book-keeping for pointer attributes!!
-        xs=self.POINTS_TO.get(attribute,[])
+        xs=self.POINTS_TO.get(attribute,[]) if self.POINTS_TO!=None else []
         if verbose: print("Existing pointers before", xs)
         if targetlevel_name+target_id not in xs:            
             xs.append(targetlevel_name+target_id)
@@ -1236,6 +2346,9 @@ class MMAX2Markable(object):
             # Do this before creating the pointer relation internally
             try:
                 self.update_attributes({attribute:str_val}, verbose=verbose)
+                # POINTS_TO might be None for CompactMMAX2Markables w/o pointers
+                if self.POINTS_TO==None:
+                    self.POINTS_TO={}
                 self.POINTS_TO[attribute]=xs
             except InvalidMMAX2AttributeException:
                 raise               
@@ -1243,6 +2356,8 @@ class MMAX2Markable(object):
 
     def points_to(self, attribute, target_id):
         r=False
+        if self.POINTS_TO==None:
+            return r
         for i in self.POINTS_TO.get(attribute,[]):
             if i == target_id:
                 r=True
@@ -1255,7 +2370,9 @@ class MMAX2Markable(object):
     def to_default(self):
         _,def_atts = self.LEVEL.get_default_attributes()
 #       self.set_attributes(def_atts)
+        self.LEVEL.unindex_attributes(self)
         self.ATTRIBUTES=def_atts
+        self.LEVEL.index_attributes(self)
 
 
     # This will *always* set this markable's attributes, but might raise an InvalidMMAX2AttributeException afterwards. 
@@ -1267,9 +2384,15 @@ class MMAX2Markable(object):
         ea=self.get_attributes().copy()
         # Update with new ones. Values of existing atts will be changed, and new att-val pairs be added. Removal does not happen.
         ea.update(new_atts)
-        raise_exception=True
         # Validate
-        validation_errors, supplied, valid, invalid, missing = self.LEVEL.validate(ea.copy())
+        self.set_validated_attributes(ea, self.LEVEL.validate(ea.copy()), add_missing=add_missing)
+
+    # Assigns ea as this markable's attributes. result is what LEVEL.validate() returned for ea. 
+    # Raises InvalidMMAX2AttributeException if result has validation errors, unless add_missing=True and 
+    # the only errors are missing attributes, which are then added to ea.
+    def set_validated_attributes(self, ea, result, add_missing=True):
+        raise_exception=True
+        validation_errors, supplied, valid, invalid, missing = result
         if missing !={}:
             # Some required attributes were missing in new_atts
             if add_missing:
@@ -1277,7 +2400,10 @@ class MMAX2Markable(object):
                 if invalid == {}:
                     # No other validation errors, just add missing ones silently and move on
                     raise_exception=False
+        self.LEVEL.unindex_attributes(self)
         self.ATTRIBUTES = ea
+        self.LEVEL.index_attributes(self)
+        self.LEVEL.UNVALIDATED.pop(self, None)
         if validation_errors and raise_exception:
             raise InvalidMMAX2AttributeException(self.LEVEL.get_name(), self.ID, supplied, valid, invalid, missing)
 
@@ -1285,6 +2411,7 @@ class MMAX2Markable(object):
         self.update_attributes(self.ATTRIBUTES)
 
     def remove_attribute(self, attname, validate=False):
+        self.LEVEL.unindex_attributes(self, {attname:self.ATTRIBUTES[attname]})
         del self.ATTRIBUTES[attname]
         if validate:
             # Trigger validation by explicity re-setting attributes
@@ -1352,8 +2479,12 @@ class MMAX2Markable(object):
 
         return (full_string, compact_string, st)
 
+    # Returns the value of the span attribute in the markable file
+    def get_span(self):
+        return spanlists_to_span(self.SPANLISTS)
+
     def to_xml(self):
-        st='<markable id="'+self.ID+'" span="'+spanlists_to_span(self.SPANLISTS)+'" mmax_level="'+self.LEVEL.get_name()+'"'
+        st='<markable id="'+self.ID+'" span="'+self.get_span()+'" mmax_level="'+self.LEVEL.get_name()+'"'
         # st='<markable id="'+self.ID+'" span="'+self.bd_list_to_spanlists(spanlists_to_span(self.SPANLISTS))+'" mmax_level="'+self.LEVEL.get_name()+'"'
         for k in sorted(self.ATTRIBUTES):
             # print(k, self.ATTRIBUTES[k])
@@ -1421,9 +2552,14 @@ class MMAX2Markable(object):
 
     def contains(self, other_markable):
         # This contains other_markable if all elements in other_markable are contained in this
-        elems=set(flatten_spanlists(self.SPANLISTS))
-        other=set(flatten_spanlists(other_markable.get_spanlists()))
-        return other.issubset(elems)
+        return ranges_contain(self.get_ranges(), other_markable.get_ranges())
+
+    # Returns the (start_pos, end_pos) range of each contiguous fragment of this markable
+    def get_ranges(self):
+        ranges=self.LEVEL.SPAN_INDEX.get_ranges(self)
+        if not ranges:
+            ranges=self.LEVEL.get_discourse().get_basedata().get_ranges(self.SPANLISTS)
+        return ranges
 
     def get_markablelevel(self):
         return self.LEVEL
@@ -1443,17 +2579,206 @@ class MMAX2Markable(object):
                 break
         return matches
 
+    # Returns the markables on level that share at least one basedata element with this,
+    # ordered by the first shared element
     def get_associated_markables(self, level):
-        result=[]
         lev=self.LEVEL.get_discourse().get_level(level)
-        for o in flatten_spanlists(self.get_spanlists()):
-            for m in lev.get_markables_for_basedata(o):
-                if m in result:
-                    continue
-                else:
-                    result.append(m)
+        overlaps=lev.SPAN_INDEX.get_overlaps(self.get_ranges())
+        return sorted(overlaps, key=overlaps.get)
+
+
+#####################################################################
+class CompactMMAX2Markable(MMAX2Markable):                          #
+# Markable that stores each contiguous fragment of its span as an   #
+# integer (start_pos, end_pos) range of basedata positions, instead #
+# of a list of all basedata ids. SPANLISTS (and get_spanlists())    #
+# are expanded from the ranges on every access, so changes to the   #
+# returned lists do not change the markable. Rendering, matching,   #
+# and to_xml() use the ranges directly. POINTS_TO is created on     #
+# demand.                                                           #
+#####################################################################
+    __slots__ = ('RANGES',)    # Flat tuple start_0, end_0, start_1, end_1, ... or the original spanlists
+
+    def __init__(self, spanlists, level, m_id="", verbose=False):
+        self.LEVEL      = level
+        self.ID         = m_id
+        self.ATTRIBUTES = {}
+        self.POINTS_TO  = None
+        self.SPANLISTS  = spanlists
+
+    def get_spanlists_from_ranges(self):
+        basedata=self.LEVEL.get_discourse().get_basedata()
+        if basedata.update_rendered_offsets():
+            # Slicing the ids of the rendered text does not access the elements
+            return [basedata.TEXT_IDS[self.RANGES[i]:self.RANGES[i+1]+1] for i in range(0, len(self.RANGES), 2)]
+        elements=basedata.get_elements()
+        return [[e[1] for e in elements[self.RANGES[i]:self.RANGES[i+1]+1]] for i in range(0, len(self.RANGES), 2)]
+
+    def set_spanlists_to_ranges(self, spanlists):
+        bdid2listpos=self.LEVEL.get_discourse().get_basedata().BDID2LISTPOS
+        ranges=[]
+        for spanlist in spanlists:
+            start, end=bdid2listpos[spanlist[0]], bdid2listpos[spanlist[-1]]
+            ranges.append(start)
+            ranges.append(end)
+            # Fragments that are not contiguous in the basedata cannot be stored as ranges
+            if end-start+1!=len(spanlist) or any(bdid2listpos[bd]!=start+i for (i, bd) in enumerate(spanlist)):
+                self.RANGES=spanlists
+                return
+        self.RANGES=tuple(ranges)
+
+    SPANLISTS = property(lambda self: self.get_spanlists_from_ranges() if isinstance(self.RANGES, tuple) else self.RANGES, 
+                         set_spanlists_to_ranges)
+
+    def get_disc_pos(self):
+        if isinstance(self.RANGES, tuple):
+            return (self.RANGES[0], self.RANGES[-1])
+        bdid2listpos=self.LEVEL.get_discourse().get_basedata().BDID2LISTPOS
+        return (bdid2listpos[self.RANGES[0][0]], bdid2listpos[self.RANGES[-1][-1]])
+
+    DISC_POS = property(get_disc_pos)
+
+    # Returns the (start_pos, end_pos) range of each contiguous fragment
+    def get_ranges(self):
+        if isinstance(self.RANGES, tuple):
+            return [(self.RANGES[i], self.RANGES[i+1]) for i in range(0, len(self.RANGES), 2)]
+        return MMAX2Markable.get_ranges(self)
+
+    def get_span(self):
+        if isinstance(self.RANGES, tuple):
+            # Only the first and last id of each fragment are needed
+            elements=self.LEVEL.get_discourse().get_basedata().get_elements()
+            return spanlists_to_span([[elements[start][1]] if start==end else [elements[start][1], elements[end][1]] for (start, end) in self.get_ranges()])
+        return MMAX2Markable.get_span(self)
+
+    def render_string(self, markup_level_name="", brackets=False, mapping=False):
+        if isinstance(self.RANGES, tuple):
+            return (self.LEVEL.get_discourse().get_basedata().render_string_impl(for_ranges=[[r] for r in self.get_ranges()], 
+                                                        markup_level_name=markup_level_name, brackets=brackets, mapping=mapping))
+        return MMAX2Markable.render_string(self, markup_level_name=markup_level_name, brackets=brackets, mapping=mapping)
+
+    def match_string(self, regexes, ignore_case=False, precompiled=False, verbose=False):
+        if isinstance(self.RANGES, tuple):
+            return self.LEVEL.get_discourse().get_basedata().match_string_impl(regexes, for_ranges=[self.get_ranges()], 
+                                                        ignore_case=ignore_case, precompiled=precompiled, verbose=verbose)
+        return MMAX2Markable.match_string(self, regexes, ignore_case=ignore_case, precompiled=precompiled, verbose=verbose)
+
+
+#####################################################################
+class MMAX2SpanIndex(object):                                       #
+# Interval index over the (start_pos, end_pos) fragments of the     #
+# markables of one level. Fragments are grouped by length class     #
+# (fragments of length 2**k .. 2**(k+1)-1 go into bucket k), and    #
+# each bucket is sorted by start position. All fragments in bucket  #
+# k that overlap a query range start at most 2**(k+1)-2 positions   #
+# before it, so each bucket only has to be searched in a small      #
+# window. Insertion and deletion use bisect, like the discourse     #
+# order of the level.                                               #
+#####################################################################
+    def __init__(self):
+        # Length class -> (sort keys (start_pos, seq), values (end_pos, markable)) at the same index
+        self.BUCKETS = {}
+        # Markable -> list of (length class, sort key, end_pos), one per fragment
+        self.ENTRIES = {}
+
+    def __len__(self):
+        return len(self.ENTRIES)
+
+    # seq is used to break ties between fragments with the same start position
+    def add(self, m, ranges, seq):
+        entries=[]
+        for (start, end) in ranges:
+            k=(end-start+1).bit_length()-1
+            try:
+                keys, values=self.BUCKETS[k]
+            except KeyError:
+                keys, values=self.BUCKETS[k]=([], [])
+            key=(start, seq)
+            i=bisect_right(keys, key)
+            keys.insert(i, key)
+            values.insert(i, (end, m))
+            entries.append((k, key, end))
+        self.ENTRIES[m]=entries
+
+    def remove(self, m):
+        for (k, key, _) in self.ENTRIES.pop(m, []):
+            keys, values=self.BUCKETS[k]
+            i=bisect_left(keys, key)
+            del keys[i]
+            del values[i]
+
+    def get_ranges(self, m):
+        return [(key[0], end) for (_, key, end) in self.ENTRIES.get(m, [])]
+
+    # (start_pos, seq) of the first fragment of m
+    def get_order_key(self, m):
+        return self.ENTRIES[m][0][1]
+
+    # Yield (start_pos, end_pos, seq, markable) for every fragment that overlaps first_pos..last_pos (incl.)
+    def iter_overlapping_fragments(self, first_pos, last_pos):
+        for (k, (keys, values)) in self.BUCKETS.items():
+            max_len=(1<<(k+1))-1
+            for i in range(bisect_left(keys, (first_pos-max_len+1,)), bisect_left(keys, (last_pos+1,))):
+                end, m=values[i]
+                if end>=first_pos:
+                    yield (keys[i][0], end, keys[i][1], m)
+
+    # Returns a dict mapping each markable with a fragment overlapping any of ranges to 
+    # (first shared position, seq)
+    def get_overlaps(self, ranges):
+        result={}
+        for (first_pos, last_pos) in ranges:
+            for (start, _, seq, m) in self.iter_overlapping_fragments(first_pos, last_pos):
+                shared=max(start, first_pos)
+                if m not in result or shared<result[m][0]:
+                    result[m]=(shared, seq)
         return result
 
+    # The following return markables in discourse order
+    def get_overlapping(self, first_pos, last_pos):
+        found={m for (_, _, _, m) in self.iter_overlapping_fragments(first_pos, last_pos)}
+        return sorted(found, key=self.get_order_key)
+
+    # Markables with one fragment that covers all of first_pos..last_pos
+    def get_containing(self, first_pos, last_pos):
+        found={m for (start, end, _, m) in self.iter_overlapping_fragments(first_pos, last_pos) if start<=first_pos and end>=last_pos}
+        return sorted(found, key=self.get_order_key)
+
+    # Markables all fragments of which are inside first_pos..last_pos
+    def get_contained_in(self, first_pos, last_pos):
+        found={m for (_, _, _, m) in self.iter_overlapping_fragments(first_pos, last_pos)}
+        found=[m for m in found if all(first_pos<=key[0] and end<=last_pos for (_, key, end) in self.ENTRIES[m])]
+        return sorted(found, key=self.get_order_key)
+
+    # Returns (distance, markable) for the markable with the smallest distance between one of its fragments
+    # and first_pos..last_pos (0 if they overlap), or (None, None). Markables in exclude are ignored.
+    # Ties are resolved in favour of the fragment that starts first.
+    def get_nearest(self, first_pos, last_pos, exclude=()):
+        best=None
+        for (k, (keys, values)) in self.BUCKETS.items():
+            max_len=(1<<(k+1))-1
+            # Fragments starting after last_pos: the first one not excluded is the nearest in this bucket
+            for i in range(bisect_left(keys, (last_pos+1,)), len(keys)):
+                if values[i][1] not in exclude:
+                    cand=(keys[i][0]-last_pos, keys[i], values[i][1])
+                    if best==None or cand[:2]<best[:2]:
+                        best=cand
+                    break
+            # Fragments starting at or before last_pos: go left until no fragment can be nearer
+            for i in range(bisect_left(keys, (last_pos+1,))-1, -1, -1):
+                start=keys[i][0]
+                if best!=None and start+max_len-1 < first_pos-best[0]:
+                    break
+                end, m=values[i]
+                if m in exclude:
+                    continue
+                cand=(max(0, first_pos-end), keys[i], m)
+                if best==None or cand[:2]<best[:2]:
+                    best=cand
+        if best==None:
+            return (None, None)
+        return (best[0], best[2])
+
 
 ###############################################################
 class MMAX2CommonPaths(object):                               #
@@ -1486,17 +2811,12 @@ class MMAX2CommonPaths(object):                               #
                     self.MARKABLE_PATH=v
 
         # Get location of this common_paths xml file
-        def_style_path = os.path.dirname(self.FILE)+self.STYLE_PATH
-        if os.path.isdir(def_style_path)==False:
-            os.makedirs(def_style_path)
-
-        def_scheme_path = os.path.dirname(self.FILE)+self.SCHEME_PATH           
-        if os.path.isdir(def_scheme_path)==False:
-            os.makedirs(def_scheme_path)
-
-        def_cust_path = os.path.dirname(self.FILE)+self.CUSTOMIZATION_PATH          
-        if os.path.isdir(def_cust_path)==False:
-            os.makedirs(def_cust_path)
+        # Each dir is checked only once, since the paths are mostly identical (all empty if no args are given)
+        for def_path in OrderedDict.fromkeys([os.path.dirname(self.FILE)+self.STYLE_PATH, 
+                                              os.path.dirname(self.FILE)+self.SCHEME_PATH, 
+                                              os.path.dirname(self.FILE)+self.CUSTOMIZATION_PATH]):
+            if os.path.isdir(def_path)==False:
+                os.makedirs(def_path)
 
     def write_scheme_stub(self, for_levelname):
         if not os.path.exists(self.DISCOURSE.get_mmax2_path(full=False)[0:-1]+self.SCHEME_PATH+for_levelname+"_scheme.xml"):
@@ -1542,23 +2862,51 @@ class MMAX2CommonPaths(object):                               #
     # load_markables() on every level.
     # multi_val_exceptions is passed to each of the latter calls, collecting all 
     # markable-level validation errors.
-    def initialize(self, mmax2proj, multi_val_exceptions, allow_duplicate_spans=True, verbose=False):
+    # With lazy=True, levels only record their markable path, and load on first access.
+    # levels and attributes restrict what is loaded (see MMAX2Discourse.load_markables()).
+    def initialize(self, mmax2proj, multi_val_exceptions, allow_duplicate_spans=True, lazy=False, levels=None, attributes=None, compact_markables=False, attribute_index=False, validate="eager", verbose=False):
         for ml in self.MARKABLELEVELS:
+            if compact_markables:
+                ml.set_compact_markables()
+            if attribute_index:
+                ml.set_attribute_index()
             # Replace project name placeholder $ with actual project names
             # Use .mmax file basename - last 5 chars (.mmax)
             if ml.get_filename().find("$")!=-1:
                 ml.set_filename_is_expanded()
                 ml.set_filename(ml.get_filename().replace("$", os.path.basename(mmax2proj.FILE)[0:-5]))
-            if verbose: 
-                #print("Probing annotation scheme at "+mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme(), file=sys.stderr)
-                print("Probing annotation scheme at "+os.path.realpath(mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme()), file=sys.stderr)
-                if os.path.exists(mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme()):
-                    print(f'\t{Back.GREEN}{Fore.BLACK}{Style.BRIGHT}SUCCESS{Style.RESET_ALL}', file=sys.stderr)
-                else:
-                    print(f'\t{Back.RED}{Fore.BLACK}{Style.BRIGHT}FAILURE{Style.RESET_ALL}', file=sys.stderr)
+            if levels!=None and ml.get_name() not in levels:
+                if verbose: print("Level "+ml.get_name()+" not requested, skipping!", file=sys.stderr)
+                ml.set_skipped()
+                continue
+            level_attributes=attributes.get(ml.get_name(),None) if attributes!=None else None
+            if lazy:
+                # The annotation scheme is set up by load_pending_markables()
+                ml.set_pending_load(mmax2proj.get_mmax2_path()+self.MARKABLE_PATH, allow_duplicate_spans=allow_duplicate_spans, attributes=level_attributes, validate=validate)
+                continue
+            self.init_annotation_scheme(ml, mmax2proj, verbose=verbose)
             # Load markables for current level 
             ml.load_markables(mmax2proj.get_mmax2_path()+self.MARKABLE_PATH, mmax2proj.get_basedata(bdtype="words"), 
-                multi_val_exceptions, allow_duplicate_spans=allow_duplicate_spans, verbose=verbose)
+                multi_val_exceptions, allow_duplicate_spans=allow_duplicate_spans, streaming=self.DISCOURSE.get_streaming() if self.DISCOURSE else True, 
+                attributes=level_attributes, validate=validate, verbose=verbose)
+
+    # Probes the annotation scheme file of ml, and sets the (shared) python annotation scheme on ml, if required.
+    # This is the case with python_schemes=True if ml has no Java attribute panel (which is always preferred then), 
+    # and with compiled_schemes=True if it has one.
+    # Only called for levels that are actually loaded, so that skipped or never accessed levels do not compile their schemes.
+    def init_annotation_scheme(self, ml, mmax2proj, verbose=False):
+        if verbose: 
+            #print("Probing annotation scheme at "+mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme(), file=sys.stderr)
+            print("Probing annotation scheme at "+os.path.realpath(mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme()), file=sys.stderr)
+            if os.path.exists(mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme()):
+                print(f'\t{Back.GREEN}{Fore.BLACK}{Style.BRIGHT}SUCCESS{Style.RESET_ALL}', file=sys.stderr)
+            else:
+                print(f'\t{Back.RED}{Fore.BLACK}{Style.BRIGHT}FAILURE{Style.RESET_ALL}', file=sys.stderr)
+        if self.DISCOURSE and ml.get_annotation_scheme()==None and \
+            ((self.DISCOURSE.get_python_schemes() and ml.get_J_MMAX2ATTRIBUTEPANEL()==None) or 
+             (self.DISCOURSE.get_compiled_schemes() and ml.get_J_MMAX2ATTRIBUTEPANEL()!=None)):
+            if os.path.exists(mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme()):
+                ml.set_annotation_scheme(get_shared_annotation_scheme(mmax2proj.get_mmax2_path()+self.SCHEME_PATH+ml.get_scheme(), verbose=verbose))
 
     def append_markablelevel(self, ml):
         self.MARKABLELEVELS.append(ml)
@@ -1608,84 +2956,180 @@ class MMAX2CommonPaths(object):                               #
             print(self.FILE+" exists and overwrite=False!")
 
 
-    def read(self, verbose=False):
+    # With shared=True, the parsed configuration is taken from a process-wide cache (see get_cached_for_file()),
+    # so that only fresh MMAX2MarkableLevel instances are created for each discourse using the same common_paths file.
+    def read(self, shared=False, verbose=False):
+        if shared:
+            config, cached=get_cached_for_file(COMMONPATHS_CONFIG_CACHE, COMMONPATHS_CONFIG_CACHE_MAX_SIZE, self.FILE, 
+                                               lambda: self.parse_config(verbose=verbose))
+            if cached and verbose: print("Using shared common paths info from "+str(os.path.realpath(self.FILE)), file=sys.stderr)
+        else:
+            config=self.parse_config(verbose=verbose)
+        self.apply_config(config, verbose=verbose)
+
+    # Returns the plain configuration from the common_paths file as a dict, w/o creating any level objects
+    def parse_config(self, verbose=False):
+        config={'scheme_path':"", 'style_path':"", 'basedata_path':"", 'customization_path':"", 'markable_path':"", 'views':[], 'levels':[]}
         with codecs.open(self.FILE, mode="r", encoding="UTF-8") as rin:
             #if verbose: print("Reading common paths info from "+str(self.FILE), file=sys.stderr)
             if verbose: print("Reading common paths info from "+str(os.path.realpath(self.FILE)), file=sys.stderr)
             soup = bs(rin.read(), 'lxml')
-            try:
-                self.SCHEME_PATH=soup.find_all("scheme_path")[0].text
-            except IndexError:
-                self.SCHEME_PATH=""
-            try:
-                self.STYLE_PATH=soup.find_all("style_path")[0].text
-            except IndexError:
-                self.STYLE_PATH=""
-            try:
-                self.BASEDATA_PATH=soup.find_all("basedata_path")[0].text
-            except IndexError:
-                self.BASEDATA_PATH=""
-            try:
-                self.CUSTOMIZATION_PATH=soup.find_all("customization_path")[0].text
-            except IndexError:
-                self.CUSTOMIZATION_PATH=""
-            try:
-                self.MARKABLE_PATH=soup.find_all("markable_path")[0].text
-            except IndexError:
-                self.MARKABLE_PATH=""
+            for k in ['scheme_path', 'style_path', 'basedata_path', 'customization_path', 'markable_path']:
+                try:
+                    config[k]=soup.find_all(k)[0].text
+                except IndexError:
+                    config[k]=""
             try:
                 for s in soup.find_all("views")[0].find_all("stylesheet"):          
-                    self.VIEWS.append(s.text)
+                    config['views'].append(s.text)
             except IndexError:
-                self.VIEWS=[]           
+                config['views']=[]           
             try:
                 for s in soup.find_all("annotations")[0].find_all("level"):
-                    level = MMAX2MarkableLevel(s['name'], 
-                                            self.DISCOURSE,
-                                            s.text,
-                                            namespace=s.get('namespace',None),
-                                            scheme=s['schemefile'], 
-                                            customization=s['customization_file'], 
-                                            create_if_missing=False, 
-                                            encoding='utf-8',
-                                            verbose=verbose,
-                                            at_startup=s.get("at_startup","active"))
-                    self.MARKABLELEVELS.append(level)
+                    config['levels'].append({'name':             s['name'], 
+                                             'file':             s.text,
+                                             'namespace':        s.get('namespace',None),
+                                             'scheme':           s['schemefile'], 
+                                             'customization':    s['customization_file'], 
+                                             'at_startup':       s.get("at_startup","active")})
             except IndexError:
-                self.MARKABLELEVELS=[]
+                config['levels']=[]
+        return config
+
+    # Sets paths and views from config, and creates a new MMAX2MarkableLevel for each level in config.
+    # config itself is not modified, so it can be shared.
+    def apply_config(self, config, verbose=False):
+        self.SCHEME_PATH        = config['scheme_path']
+        self.STYLE_PATH         = config['style_path']
+        self.BASEDATA_PATH      = config['basedata_path']
+        self.CUSTOMIZATION_PATH = config['customization_path']
+        self.MARKABLE_PATH      = config['markable_path']
+        self.VIEWS.extend(config['views'])
+        for l in config['levels']:
+            level = MMAX2MarkableLevel(l['name'], 
+                                    self.DISCOURSE,
+                                    l['file'],
+                                    namespace=l['namespace'],
+                                    scheme=l['scheme'], 
+                                    customization=l['customization'], 
+                                    create_if_missing=False, 
+                                    encoding='utf-8',
+                                    verbose=verbose,
+                                    at_startup=l['at_startup'])
+            self.MARKABLELEVELS.append(level)
 
 #######################
 class Basedata(object):
 ####################### 
-    def __init__ (self, filename, bdtype='word', encoding='utf-8', verbose=False):
+    # streaming=True uses the lxml iterparse loader, streaming=False the original BeautifulSoup loader.
+    # Both produce identical DCELEMENTS and BDID2LISTPOS: Files which lxml would reject or read differently 
+    # (see has_non_xml_entities()) are read with the BeautifulSoup loader in any case.
+    # snapshot is an (encoding, DCELEMENTS) tuple as returned by get_snapshot(), which will be used instead of the file.
+    # columnar=True stores elements in a ColumnarElements instance instead of a list of tuples. 
+    # This is much more compact, and DCELEMENTS and BDID2LISTPOS can be used in the same way (but see ColumnarElements).
+    def __init__ (self, filename, bdtype='word', encoding='utf-8', streaming=True, snapshot=None, columnar=False, verbose=False):
         self.BDTYPE=bdtype
         self.FILENAME=filename
-        self.DCELEMENTS=list()
+        self.COLUMNAR=columnar
+        self.DCELEMENTS, self.BDID2LISTPOS = self.new_element_store()
         self.TAGS={}
-        self.BDID2LISTPOS={}
+        # Rendered text of all elements (as returned by render_string_impl()) with offsets, created on demand
+        self.clear_rendered_text()
         #self.DISCOURSE=disc
 
+        if snapshot!=None:
+            self.ENCODING, elements = snapshot
+            # The snapshot might have been created with the other storage type
+            if isinstance(elements, ColumnarElements)==self.COLUMNAR:
+                self.DCELEMENTS=elements
+                if self.COLUMNAR:
+                    self.BDID2LISTPOS=ColumnarPositions(self.DCELEMENTS)
+            else:
+                for e in elements:
+                    self.DCELEMENTS.append(e)
+            if not self.COLUMNAR:
+                for (_, bd_id, pos, _) in self.DCELEMENTS:
+                    self.BDID2LISTPOS[bd_id]=pos
         # Set encoding from supplied file
-        if os.path.exists(self.FILENAME):
-            # Changed from r to rb
-            with open(self.FILENAME,"rb") as win:
-                raw=win.read()
-                self.ENCODING = EncodingDetector.find_declared_encoding(raw, is_html=False)
-                soup = bs(raw, 'lxml')              
-            for w in soup.find_all(self.BDTYPE):
+        elif os.path.exists(self.FILENAME):
+            if streaming:
+                self.load_elements_streaming(verbose=verbose)
+            else:
+                self.load_elements_soup()
+        else:
+            # Set supplied encoding (for Basedata yet to be created)
+            self.ENCODING=encoding      
+
+    def load_elements_soup(self):
+        # Changed from r to rb
+        with open(self.FILENAME,"rb") as win:
+            raw=win.read()
+            self.ENCODING = EncodingDetector.find_declared_encoding(raw, is_html=False)
+            soup = bs(raw, 'lxml')              
+        for w in soup.find_all(self.BDTYPE):
+            # dcelement = tuple of (string, id, discpos, attribs)               
+            atts=None
+            for att in w.attrs:
+                if att!="id":
+                    # Create bd-level attributes only if needed, i.e. if non-id-attributes are present
+                    if not atts:
+                        atts = {}
+                    atts[att]=w.attrs[att]
+            self.DCELEMENTS.append((w.get_text(), w['id'], len(self.DCELEMENTS), atts))
+            self.BDID2LISTPOS[w['id']]=len(self.DCELEMENTS)-1           
+
+    # Fill DCELEMENTS and BDID2LISTPOS element by element, without building a tree of the whole file.
+    # Falls back to load_elements_soup() for files with non-XML entities, or which are not well-formed XML.
+    def load_elements_streaming(self, verbose=False):
+        if has_non_xml_entities(self.FILENAME):
+            if verbose: print("Non-XML entities in "+self.FILENAME+", using BeautifulSoup loader", file=sys.stderr)
+            self.load_elements_soup()
+            return
+        try:
+            self.load_elements_iterparse()
+        except etree.XMLSyntaxError as ex:
+            if verbose: print("Cannot stream "+self.FILENAME+" ("+str(ex)+"), using BeautifulSoup loader", file=sys.stderr)
+            self.DCELEMENTS, self.BDID2LISTPOS = self.new_element_store()
+            self.load_elements_soup()
+
+    def load_elements_iterparse(self):
+        with open(self.FILENAME,"rb") as win:
+            # The xml declaration is at the very start, so the header is enough for detecting the encoding
+            self.ENCODING = EncodingDetector.find_declared_encoding(win.read(1024), is_html=False)
+            win.seek(0)
+            for _, w in etree.iterparse(win, events=("end",), resolve_entities=False, huge_tree=True):
+                # Match bd elements with and without namespace, and in any case (like the soup loader)
+                if w.tag.rpartition("}")[2].lower()!=self.BDTYPE:
+                    continue
                 # dcelement = tuple of (string, id, discpos, attribs)               
                 atts=None
-                for att in w.attrs:
-                    if att!="id":
+                bd_id=None
+                for (att, val) in w.attrib.items():
+                    # The soup loader sees lower-cased attribute names only
+                    att=att.lower()
+                    if att=="id":
+                        bd_id=val
+                    else:
                         # Create bd-level attributes only if needed, i.e. if non-id-attributes are present
                         if not atts:
                             atts = {}
-                        atts[att]=w.attrs[att]
-                self.DCELEMENTS.append((w.get_text(), w['id'], len(self.DCELEMENTS), atts))
-                self.BDID2LISTPOS[w['id']]=len(self.DCELEMENTS)-1           
-        else:
-            # Set supplied encoding (for Basedata yet to be created)
-            self.ENCODING=encoding      
+                        atts[att]=val
+                self.DCELEMENTS.append(("".join(w.itertext()), bd_id, len(self.DCELEMENTS), atts))
+                self.BDID2LISTPOS[bd_id]=len(self.DCELEMENTS)-1
+                # Free the current element and all already processed siblings
+                w.clear()
+                while w.getprevious() is not None:
+                    del w.getparent()[0]
+
+    # Returns empty (DCELEMENTS, BDID2LISTPOS) of the storage type of this basedata
+    def new_element_store(self):
+        if self.COLUMNAR:
+            elements=ColumnarElements(self.BDTYPE)
+            return elements, ColumnarPositions(elements)
+        return list(), {}
+
+    def get_snapshot(self):
+        return (self.ENCODING, self.DCELEMENTS)
 
     def get_moving_window(self, n=3):
         for i in range(len(self.DCELEMENTS)-(n-1)):
@@ -1803,7 +3247,169 @@ class Basedata(object):
         return bd_ids
 
 
-    def render_string_impl(self, for_ids=None, markup_level_name="", disc=None, brackets=False, mapping=False, verbose=False):
+    # Sets the rendered text and its offsets to be recreated on the next access. Called by all methods changing elements.
+    def clear_rendered_text(self):
+        self.RENDERED_TEXT  = None      # Rendered text of all elements, or False if it cannot be created (for invalid spc values)
+        self.RENDERED_TAIL  = []        # Padded texts of elements appended since RENDERED_TEXT was last joined
+        self.RENDERED_SIZE  = -1        # Number of elements covered by RENDERED_TEXT and RENDERED_TAIL
+        self.TEXT_STARTS    = None      # Element i is RENDERED_TEXT[TEXT_STARTS[i]:TEXT_ENDS[i]], its padding ends at TEXT_STARTS[i]
+        self.TEXT_ENDS      = None      # and starts at TEXT_ENDS[i-1] (or 0)
+        self.TEXT_IDS       = None      # Element ids in list order
+
+    # Returns the number of spaces rendered before an element with atts, or raises ValueError
+    def get_padding(self, atts):
+        # Default 1 is correct because one space is the default
+        l_spaces=1 if not atts else int(atts.get('spc','1'))
+        if l_spaces<0:
+            raise ValueError("Negative spc value "+str(l_spaces))
+        return l_spaces
+
+    # Makes sure that TEXT_STARTS, TEXT_ENDS and TEXT_IDS cover all elements. They are created once, and updated on add_element()
+    # (other changes make them be created anew). Returns False if the text cannot be rendered. 
+    # Callers which only need the offsets should use this, since it does not join the texts of appended elements.
+    def update_rendered_offsets(self):
+        if self.RENDERED_SIZE!=len(self.DCELEMENTS):
+            # Elements might also have been added to DCELEMENTS directly
+            self.clear_rendered_text()
+            parts, starts, ends, ids = [], array('q'), array('q'), []
+            offset=0
+            try:
+                for (te, bd_id, _, atts) in self.DCELEMENTS:
+                    l_spaces=self.get_padding(atts)
+                    parts.append(" "*l_spaces+te)
+                    starts.append(offset+l_spaces)
+                    offset+=l_spaces+len(te)
+                    ends.append(offset)
+                    ids.append(bd_id)
+                self.RENDERED_TEXT="".join(parts)
+                self.TEXT_STARTS, self.TEXT_ENDS, self.TEXT_IDS = starts, ends, ids
+            except ValueError:
+                self.RENDERED_TEXT=False
+            self.RENDERED_SIZE=len(self.DCELEMENTS)
+        return self.RENDERED_TEXT!=False
+
+    # Returns the rendered text of all elements (the same as render_string_impl()[0]), or None if it cannot be created.
+    # Texts of elements appended since the last call are joined only here, once.
+    def get_rendered_text(self):
+        if not self.update_rendered_offsets():
+            return None
+        if self.RENDERED_TAIL:
+            self.RENDERED_TEXT=self.RENDERED_TEXT+"".join(self.RENDERED_TAIL)
+            self.RENDERED_TAIL=[]
+        return self.RENDERED_TEXT
+
+    # Adds the element just appended at the end of DCELEMENTS to the rendered text, if it exists
+    def extend_rendered_text(self, bd_text, bd_id, bd_attribs):
+        if self.TEXT_IDS!=None and self.RENDERED_SIZE==len(self.DCELEMENTS)-1:
+            try:
+                l_spaces=self.get_padding(bd_attribs)
+            except ValueError:
+                self.clear_rendered_text()
+                return
+            self.RENDERED_TAIL.append(" "*l_spaces+bd_text)
+            self.TEXT_STARTS.append(self.TEXT_ENDS[-1]+l_spaces if len(self.TEXT_ENDS)>0 else l_spaces)
+            self.TEXT_ENDS.append(self.TEXT_STARTS[-1]+len(bd_text))
+            self.TEXT_IDS.append(bd_id)
+            self.RENDERED_SIZE+=1
+
+    # Returns the (start, end) offsets of the text of bd_id in the rendered text, or None
+    def get_text_offsets(self, bd_id):
+        pos=self.get_rendered_position(bd_id)
+        if pos==None:
+            return None
+        return (self.TEXT_STARTS[pos], self.TEXT_ENDS[pos])
+
+    # Returns the id of the element whose text covers offset in the rendered text, or None for spaces (and invalid offsets)
+    def get_element_at_offset(self, offset):
+        if not self.update_rendered_offsets() or offset<0:
+            return None
+        pos=bisect_right(self.TEXT_STARTS, offset)-1
+        if pos>=0 and offset<self.TEXT_ENDS[pos]:
+            return self.TEXT_IDS[pos]
+        return None
+
+    # Returns the list positions of all elements whose text overlaps start..end (excl.) in the rendered text.
+    # Elements with empty text are never included.
+    def get_positions_for_offsets(self, start, end):
+        if not self.update_rendered_offsets():
+            return []
+        starts, ends = self.TEXT_STARTS, self.TEXT_ENDS
+        return [pos for pos in range(bisect_right(ends, start), bisect_left(starts, end)) if starts[pos]<ends[pos]]
+
+    # Returns the list position of bd_id in the rendered text, or None if it is unknown or BDID2LISTPOS is not up to date for it
+    def get_rendered_position(self, bd_id):
+        if not self.update_rendered_offsets():
+            return None
+        pos=self.BDID2LISTPOS.get(bd_id,None)
+        if pos==None or pos>=len(self.TEXT_IDS) or self.TEXT_IDS[pos]!=bd_id:
+            return None
+        return pos
+
+    # Renders for_ids (or for_ranges) by slicing the rendered text, once per run of consecutive elements.
+    # Returns the same as render_string_impl() w/o markup, or None if for_ids cannot be rendered like this.
+    def render_string_from_text(self, for_ids=None, brackets=False, mapping=False, verbose=False, for_ranges=None):
+        text=self.get_rendered_text()
+        if text==None:
+            return None
+        starts, ends, all_ids = self.TEXT_STARTS, self.TEXT_ENDS, self.TEXT_IDS
+        if for_ranges!=None:
+            if any(last>=len(all_ids) for runs in for_ranges for (_, last) in runs):
+                return None
+            span_runs=for_ranges
+        # for_ids == None means all basedata elements, which will always be continuous
+        elif not for_ids:
+            span_runs=[[(0, len(all_ids)-1)]] if len(all_ids)>0 else [[]]
+        else:
+            span_runs=[]
+            for spanlist in for_ids:
+                runs=[]
+                for bd_id in spanlist:
+                    pos=self.get_rendered_position(bd_id)
+                    if pos==None:
+                        return None
+                    if len(runs)>0 and runs[-1][1]==pos-1:
+                        runs[-1]=(runs[-1][0], pos)
+                    else:
+                        runs.append((pos, pos))
+                span_runs.append(runs)
+
+        if not brackets and len(span_runs)>1:
+            brackets=True
+
+        m_string=""
+        words, ids, run_offsets, run_ranges = [], [], [], []
+        for runs in span_runs:
+            for (first, last) in runs:
+                # Each element is rendered with its padding, which starts where the preceding element ends
+                seg_start=ends[first-1] if first>0 else 0
+                if mapping:
+                    run_offsets.append(len(m_string))
+                    run_ranges.append((seg_start, first, last))
+                m_string=m_string+text[seg_start:ends[last]]
+                words.extend([text[starts[i]:ends[i]] for i in range(first, last+1)])
+                ids.extend(all_ids[first:last+1])
+            if verbose: print("Rendered:", m_string)
+            m_string="["+m_string+"]" if brackets else m_string
+            m_string=m_string+".."
+        pos2id=RenderedPositions(starts, ends, all_ids, run_offsets, run_ranges) if mapping else {}
+        return m_string[:-2], words, ids, pos2id
+
+    # Without markup, the string is sliced from the rendered text of all elements, 
+    # and pos2id is a RenderedPositions instance instead of a dict.
+    # for_ranges can be supplied instead of for_ids, as a list with a list of (first_pos, last_pos) ranges per spanlist.
+    def render_string_impl(self, for_ids=None, markup_level_name="", disc=None, brackets=False, mapping=False, verbose=False, for_ranges=None):
+        markup_level=None
+        if disc and markup_level_name!="":
+            markup_level=disc.get_level(markup_level_name)
+
+        if markup_level==None:
+            rendered=self.render_string_from_text(for_ids=for_ids, brackets=brackets, mapping=mapping, verbose=verbose, for_ranges=for_ranges)
+            if rendered!=None:
+                return rendered
+
+        if for_ranges!=None:
+            for_ids=[[self.DCELEMENTS[pos][1] for (first, last) in runs for pos in range(first, last+1)] for runs in for_ranges]
+
         m_string=""
         pos2id={}
         last_pos=0
@@ -1817,10 +3423,6 @@ class Basedata(object):
         if not brackets and len(for_ids)>1:
             brackets=True
 
-        markup_level=None
-        if disc and markup_level_name!="":
-            markup_level=disc.get_level(markup_level_name)
-
         for spanlist in for_ids:
             for sid, bd_id in enumerate(spanlist):
                 te=self.get_element_text(bd_id)
@@ -2005,9 +3607,11 @@ class Basedata(object):
             self.DCELEMENTS.append((bd_text, bd_id, len(self.DCELEMENTS), bd_attribs))
             # New bd gets bdidlistpos at the end
             self.BDID2LISTPOS[bd_id]=len(self.DCELEMENTS)-1     
+            self.extend_rendered_text(bd_text, bd_id, bd_attribs)
         else:
             self.DCELEMENTS.insert(at_position, (bd_text, bd_id, at_position, bd_attribs))
             self.BDID2LISTPOS[bd_id]=at_position
+            self.clear_rendered_text()
         return bd_id
 
 
@@ -2021,10 +3625,16 @@ class Basedata(object):
         return bd_id
 
     # This matches cross-basedata, so it is independent of tokenization
-    def match_string_impl(self, regexes, for_ids=None, ignore_case=False, precompiled=False, group="m", verbose=False):
+    # for_ranges can be supplied instead of for_ids, as for render_string_impl()
+    def match_string_impl(self, regexes, for_ids=None, ignore_case=False, precompiled=False, group="m", verbose=False, for_ranges=None):
         # regexes is a list of (regex, label, pt) tuples, where label is optional
+        if not for_ids and for_ranges==None and self.get_rendered_text()!=None:
+            # The whole document is rendered anyway
+            return [([[span_for_match] for (_, _, span_for_match, _) in doc_matches], reg, label, pt) 
+                    for (doc_matches, reg, label, pt) in self.match_document(regexes, ignore_case=ignore_case, precompiled=precompiled, verbose=verbose) 
+                    if len(doc_matches)>0]
         all_results=[]
-        string, words, _, pos2id=self.render_string_impl(for_ids=for_ids, mapping=True)
+        string, words, _, pos2id=self.render_string_impl(for_ids=for_ids, mapping=True, for_ranges=for_ranges)
         # print(string)
         # Look at each reg individually
         for exp in regexes:
@@ -2056,14 +3666,17 @@ class Basedata(object):
 
                 span_for_match=[]
                 if verbose: print("'%s'"%(match), file=sys.stderr)          
-                for t in range(start, end):
-                    try:
-                        bd_id=pos2id[t]
-                    except KeyError:
-                        # Skip space
-                        continue
-                    if len(span_for_match) == 0 or span_for_match[-1]!=bd_id:
-                        span_for_match.append(bd_id)
+                if isinstance(pos2id, RenderedPositions):
+                    span_for_match=pos2id.get_ids_between(start, end)
+                else:
+                    for t in range(start, end):
+                        try:
+                            bd_id=pos2id[t]
+                        except KeyError:
+                            # Skip space
+                            continue
+                        if len(span_for_match) == 0 or span_for_match[-1]!=bd_id:
+                            span_for_match.append(bd_id)
                 if len(span_for_match)>0:
                     #results_for_reg.append(([span_for_match],match))
                     results_for_reg.append([span_for_match])
@@ -2072,6 +3685,36 @@ class Basedata(object):
                 all_results.append((results_for_reg,reg,label,pt))
         return all_results
 
+    # Matches each regex once against the rendered text of all elements. 
+    # regexes is a list of (regex, label, pt) tuples as for match_string_impl(), where label and pt are optional.
+    # Returns one (doc_matches, reg, label, pt) tuple per regex (also if there was no match), where doc_matches is a 
+    # list of (first_pos, last_pos, span_for_match, matched) tuples, one per match, with span_for_match the ids of the matched 
+    # elements, and matched the matched string.
+    # The matched span is the one of group (if it is not None or empty), and matches w/o any element text are ignored.
+    def match_document(self, regexes, ignore_case=False, precompiled=False, group="m", verbose=False):
+        text=self.get_rendered_text()
+        if text==None:
+            raise ValueError("Basedata "+str(self.FILENAME)+" cannot be rendered (invalid spc value)")
+        all_results=[]
+        for exp in regexes:
+            pt=False
+            reg=exp[0]
+            # For precompiled res, ignorecase is ignored, as it is compiled into the re already
+            if ignore_case and not precompiled:
+                reg="(?i)"+reg
+            label=reg
+            if len(exp)>1:  label=exp[1]
+            if len(exp)>2:  pt=exp[2]
+            doc_matches=[]
+            for match in (reg.finditer(text) if precompiled else re.finditer(reg, text)):
+                start, end = match.span(group) if group else match.span()
+                if verbose: print("'%s'"%(match), file=sys.stderr)
+                positions=self.get_positions_for_offsets(start, end)
+                if len(positions)>0:
+                    doc_matches.append((positions[0], positions[-1], [self.TEXT_IDS[pos] for pos in positions], text[start:end]))
+            all_results.append((doc_matches, reg, label, pt))
+        return all_results
+
     def set_attribute_value_for(self, bd_id, att, val):
         pos_to_change=self.BDID2LISTPOS[bd_id]
         st, bid, dpos, atts = self.DCELEMENTS[pos_to_change]
@@ -2079,6 +3722,7 @@ class Basedata(object):
             atts={}
         atts[att]=val
         self.DCELEMENTS[pos_to_change]=(st,bid,dpos,atts)
+        self.clear_rendered_text()
 
     def get_elements(self):
         return self.DCELEMENTS
@@ -2091,6 +3735,7 @@ class Basedata(object):
         if new_string: string=new_string
         if new_atts: atts=new_atts
         self.DCELEMENTS[self.BDID2LISTPOS[bd_id]]=(string,bd_id,pos,atts)
+        self.clear_rendered_text()
 
 
 #    def set_element_string(self, bd_id, newstring):
@@ -2144,14 +3789,29 @@ class Basedata(object):
         return self.delete_all_elements()
 
     def delete_all_elements(self):
-        self.DCELEMENTS=list()
-        self.BDID2LISTPOS={}
+        self.DCELEMENTS, self.BDID2LISTPOS = self.new_element_store()
+        self.clear_rendered_text()
         return self
 
     def remove_all_elements(self):
         return self.delete_all_elements()
 
+    # Fast path: Look up both ids in BDID2LISTPOS and slice. 
+    # This gives the same result as the scan, unless the ids are not in monotonic order (or unknown).
     def interpolate_span(self, first_id, last_id, return_elements=False):
+        first_pos=self.BDID2LISTPOS.get(first_id,None)
+        last_pos=self.BDID2LISTPOS.get(last_id,None)
+        if first_pos!=None and last_pos!=None and first_pos<=last_pos:
+            elements=self.DCELEMENTS[first_pos:last_pos+1]
+            # Make sure positions are up to date (add_element(at_position=...) does not update them)
+            if elements[0][1]==first_id and elements[-1][1]==last_id:
+                if return_elements:
+                    return elements
+                return [e[1] for e in elements]
+        return self.interpolate_span_scan(first_id, last_id, return_elements=return_elements)
+
+    # Collect elements from first_id to last_id by scanning DCELEMENTS from the start of the document
+    def interpolate_span_scan(self, first_id, last_id, return_elements=False):
         r=[]
         collecting=False
         for i in self.DCELEMENTS:
@@ -2166,11 +3826,36 @@ class Basedata(object):
                 break
         return r
 
-    def get_preceding_elements(self, bd_id, width=10):
+    # Returns one (start_pos, end_pos) range per run of consecutive basedata elements in spanlists
+    def get_ranges(self, spanlists):
+        ranges=[]
+        for spanlist in spanlists:
+            start=None
+            for bd in spanlist:
+                pos=self.BDID2LISTPOS[bd]
+                if start!=None and pos==end+1:
+                    end=pos
+                else:
+                    if start!=None:
+                        ranges.append((start, end))
+                    start=end=pos
+            if start!=None:
+                ranges.append((start, end))
+        return ranges
+
+    # Returns the list position of bd_id, using BDID2LISTPOS if it is up to date for bd_id, and scanning otherwise.
+    # Raises KeyError if bd_id does not exist.
+    def get_position(self, bd_id):
+        pos=self.BDID2LISTPOS.get(bd_id,None)
+        if pos!=None and pos<len(self.DCELEMENTS) and self.DCELEMENTS[pos][1]==bd_id:
+            return pos
         for (pos,i) in enumerate(self.DCELEMENTS):
             if i[1]==bd_id:
-                start_pos=pos
-                break
+                return pos
+        raise KeyError(bd_id)
+
+    def get_preceding_elements(self, bd_id, width=10):
+        start_pos=self.get_position(bd_id)
         pad=False
         if start_pos-width<0:
             width=start_pos
@@ -2178,75 +3863,367 @@ class Basedata(object):
         return(self.DCELEMENTS[start_pos-width:start_pos], pad)
 
     def get_following_elements(self, bd_id, width=10):
-        for (pos,i) in enumerate(self.DCELEMENTS):
-            if i[1]==bd_id:
-                start_pos=pos+1
-                break
+        start_pos=self.get_position(bd_id)+1
         pad=False
         if start_pos+width>=len(self.DCELEMENTS):
             width=len(self.DCELEMENTS)
             pad=True
         return(self.DCELEMENTS[start_pos:start_pos+width], pad)
 
+###################################################################
+class ColumnarElements(Sequence):                                 #
+# Compact storage for basedata elements. Behaves like the list of #
+# (string, id, discpos, attribs) tuples in Basedata.DCELEMENTS,   #
+# but keeps all strings in one text buffer with an offsets array, #
+# numeric ids (from e.g. word_N) in an int array, and attribute   #
+# values dictionary-encoded, with one code array per attribute.   #
+# Tuples and attribute dicts are created on access, so modifying  #
+# a returned dict does *not* change the stored element. Use       #
+# Basedata.set_attribute_value_for() or update_element() instead. #
+# Appending is cheap, but inserting and changing element strings  #
+# shift the arrays of all following elements, and are O(n).      #
+###################################################################
+    def __init__(self, bdtype='word'):
+        self.ID_PREFIX      = bdtype+"_"
+        self.TEXT           = ""
+        self.TEXT_CHUNKS    = []                # Joined TEXT_TAILs, not yet added to TEXT
+        self.TEXT_TAIL      = []                # Strings appended since TEXT was last joined
+        self.OFFSETS        = array('I', [0])   # Element i is TEXT[OFFSETS[i]:OFFSETS[i+1]]
+        self.IDNUMS         = array('q')        # Numeric id part, or -1 if the id does not have the form <bdtype>_<int>
+        self.EXTRA_IDS      = {}                # Position to full id, for all ids with IDNUMS -1
+        self.MONOTONIC      = True              # True while all ids are numeric and strictly increasing
+        self.ATT_COLUMNS    = {}                # Attribute name to array of value codes (0 = attribute not set)
+        self.ATT_VALUES     = {}                # Attribute name to list of values (index = code)
+        self.ATT_CODES      = {}                # Attribute name to dict of value to code
+        self.ID2POS         = None              # Lookup dict for non-monotonic ids, created on demand
+
+    def __len__(self):
+        return len(self.IDNUMS)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.get_element_at(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i+=len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("ColumnarElements index out of range")
+        return self.get_element_at(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get_element_at(i)
+
+    def __setitem__(self, i, element):
+        if i < 0:
+            i+=len(self)
+        text, bd_id, _, atts = element
+        if text!=self.get_text_at(i):
+            self.set_text_at(i, text)
+        if bd_id!=self.get_id_at(i):
+            self.set_id_at(i, bd_id)
+        for (att, column) in self.ATT_COLUMNS.items():
+            column[i]=0
+        if atts:
+            for (att, val) in atts.items():
+                self.set_attribute_at(i, att, val)
+
+    def __reduce__(self):
+        self.get_text()
+        return (self.__class__, (self.ID_PREFIX[:-1],), 
+                {k:v for (k,v) in self.__dict__.items() if k!='ID2POS'})
+
+    def get_text(self):
+        if self.TEXT_CHUNKS or self.TEXT_TAIL:
+            self.TEXT=self.TEXT+"".join(self.TEXT_CHUNKS)+"".join(self.TEXT_TAIL)
+            self.TEXT_CHUNKS=[]
+            self.TEXT_TAIL=[]
+        return self.TEXT
+
+    def get_text_at(self, i):
+        return self.get_text()[self.OFFSETS[i]:self.OFFSETS[i+1]]
+
+    def get_id_at(self, i):
+        num=self.IDNUMS[i]
+        return self.ID_PREFIX+str(num) if num!=-1 else self.EXTRA_IDS[i]
+
+    def get_attributes_at(self, i):
+        atts=None
+        for (att, column) in self.ATT_COLUMNS.items():
+            code=column[i]
+            if code!=0:
+                if not atts:
+                    atts={}
+                atts[att]=self.ATT_VALUES[att][code]
+        return atts
+
+    def get_element_at(self, i):
+        return (self.get_text_at(i), self.get_id_at(i), i, self.get_attributes_at(i))
+
+    # Returns the numeric part of bd_id, or -1
+    def get_idnum(self, bd_id):
+        if bd_id.startswith(self.ID_PREFIX):
+            num=bd_id[len(self.ID_PREFIX):]
+            # Ids with leading zeros or non-ASCII digits (which isdigit() and int() accept) cannot be restored from the number
+            if re.fullmatch(r'[0-9]+', num) and str(int(num))==num:
+                return int(num)
+        return -1
+
+    def append(self, element):
+        text, bd_id, _, atts = element
+        i=len(self)
+        self.TEXT_TAIL.append(text)
+        if len(self.TEXT_TAIL)==4096:
+            # Do not keep one string object per element while appending
+            self.TEXT_CHUNKS.append("".join(self.TEXT_TAIL))
+            self.TEXT_TAIL=[]
+        self.OFFSETS.append(self.OFFSETS[-1]+len(text))
+        num=self.get_idnum(bd_id)
+        if num==-1:
+            self.EXTRA_IDS[i]=bd_id
+            self.MONOTONIC=False
+        elif i>0 and (not self.MONOTONIC or num<=self.IDNUMS[-1]):
+            self.MONOTONIC=False
+        self.IDNUMS.append(num)
+        for column in self.ATT_COLUMNS.values():
+            column.append(0)
+        if atts:
+            for (att, val) in atts.items():
+                self.set_attribute_at(i, att, val)
+        if self.ID2POS!=None:
+            self.ID2POS[bd_id]=i
+
+    # Like list.insert(). This shifts the text, offsets, ids and attribute codes of all following elements, so it is O(n).
+    def insert(self, at_position, element):
+        n=len(self)
+        if at_position<0:
+            at_position=max(0, at_position+n)
+        if at_position>=n:
+            self.append(element)
+            return
+        text, bd_id, _, atts = element
+        old=self.get_text()
+        self.TEXT=old[:self.OFFSETS[at_position]]+text+old[self.OFFSETS[at_position]:]
+        self.OFFSETS[at_position+1:]=array(self.OFFSETS.typecode, [o+len(text) for o in self.OFFSETS[at_position:]])
+        num=self.get_idnum(bd_id)
+        self.IDNUMS.insert(at_position, num)
+        self.EXTRA_IDS={(j+1 if j>=at_position else j):v for (j,v) in self.EXTRA_IDS.items()}
+        if num==-1:
+            self.EXTRA_IDS[at_position]=bd_id
+        self.MONOTONIC=self.MONOTONIC and num!=-1 and (at_position==0 or self.IDNUMS[at_position-1]<num) and num<self.IDNUMS[at_position+1]
+        for column in self.ATT_COLUMNS.values():
+            column.insert(at_position, 0)
+        if atts:
+            for (att, val) in atts.items():
+                self.set_attribute_at(at_position, att, val)
+        self.ID2POS=None
+
+    # This shifts the offsets of all following elements, so it is O(n) if the length of the string changes
+    def set_text_at(self, i, text):
+        old=self.get_text()
+        delta=len(text)-(self.OFFSETS[i+1]-self.OFFSETS[i])
+        self.TEXT=old[:self.OFFSETS[i]]+text+old[self.OFFSETS[i+1]:]
+        if delta!=0:
+            self.OFFSETS[i+1:]=array(self.OFFSETS.typecode, [o+delta for o in self.OFFSETS[i+1:]])
+
+    def set_id_at(self, i, bd_id):
+        num=self.get_idnum(bd_id)
+        self.EXTRA_IDS.pop(i, None)
+        if num==-1:
+            self.EXTRA_IDS[i]=bd_id
+        self.IDNUMS[i]=num
+        self.MONOTONIC=-1 not in self.IDNUMS and all(self.IDNUMS[j]<self.IDNUMS[j+1] for j in range(len(self)-1))
+        self.ID2POS=None
+
+    def set_attribute_at(self, i, att, val):
+        column=self.ATT_COLUMNS.get(att,None)
+        if column==None:
+            column=array('B', bytes(len(self)))
+            self.ATT_COLUMNS[att]=column
+            self.ATT_VALUES[att]=[None]
+            self.ATT_CODES[att]={}
+        code=self.ATT_CODES[att].get(val,None)
+        if code==None:
+            code=len(self.ATT_VALUES[att])
+            self.ATT_VALUES[att].append(val)
+            self.ATT_CODES[att][val]=code
+            if code > 2**(8*column.itemsize)-1:
+                # Widen code array 
+                column=array('H' if column.typecode=='B' else 'I', column)
+                self.ATT_COLUMNS[att]=column
+        column[i]=code
+
+    # Returns the position of bd_id, or raises KeyError
+    def get_position(self, bd_id):
+        if self.MONOTONIC:
+            num=self.get_idnum(bd_id)
+            if num!=-1:
+                pos=bisect_left(self.IDNUMS, num)
+                if pos < len(self) and self.IDNUMS[pos]==num:
+                    return pos
+            raise KeyError(bd_id)
+        if self.ID2POS==None:
+            self.ID2POS={}
+            for i in range(len(self)):
+                self.ID2POS[self.get_id_at(i)]=i
+        return self.ID2POS[bd_id]
+
+
+class ColumnarPositions(Mapping):
+# Replaces the BDID2LISTPOS dict for ColumnarElements.
+# Positions are derived from the elements, so setting them has no effect.
+    def __init__(self, elements):
+        self.ELEMENTS = elements
+
+    def __getitem__(self, bd_id):
+        return self.ELEMENTS.get_position(bd_id)
+
+    def __setitem__(self, bd_id, pos):
+        pass
+
+    def __iter__(self):
+        for i in range(len(self.ELEMENTS)):
+            yield self.ELEMENTS.get_id_at(i)
+
+    def __len__(self):
+        return len(self.ELEMENTS)
+
+
+class RenderedPositions(Mapping):
+# Replaces the pos2id dict returned by Basedata.render_string_impl() when rendering from the rendered text.
+# Maps each char position covered by an element text to the element id, like the dict, but finds it by bisect
+# over the runs of consecutive elements in the rendered string, and the element offsets in the rendered text.
+    def __init__(self, starts, ends, ids, run_offsets, run_ranges):
+        self.STARTS         = starts        # Element offsets and ids in the rendered text of the basedata
+        self.ENDS           = ends
+        self.IDS            = ids
+        self.RUN_OFFSETS    = run_offsets   # Start of each run in the rendered string (ascending)
+        self.RUN_RANGES     = run_ranges    # (start in rendered text, first pos, last pos) of each run
+        self.LENGTH         = None
+
+    def __getitem__(self, i):
+        try:
+            r=bisect_right(self.RUN_OFFSETS, i)-1
+        except TypeError:
+            raise KeyError(i)
+        if r>=0:
+            seg_start, first, last = self.RUN_RANGES[r]
+            offset=i-self.RUN_OFFSETS[r]+seg_start
+            if offset<self.ENDS[last]:
+                pos=bisect_right(self.STARTS, offset, first, last+1)-1
+                if pos>=first and offset<self.ENDS[pos]:
+                    return self.IDS[pos]
+        raise KeyError(i)
+
+    def __iter__(self):
+        for (run_offset, (seg_start, first, last)) in zip(self.RUN_OFFSETS, self.RUN_RANGES):
+            for pos in range(first, last+1):
+                yield from range(self.STARTS[pos]-seg_start+run_offset, self.ENDS[pos]-seg_start+run_offset)
+
+    # Returns the ids of all elements with chars in start..end (excl.), w/o consecutive repetitions (like collecting them from the dict)
+    def get_ids_between(self, start, end):
+        ids=[]
+        for r in range(max(bisect_right(self.RUN_OFFSETS, start)-1, 0), bisect_left(self.RUN_OFFSETS, end)):
+            seg_start, first, last = self.RUN_RANGES[r]
+            shift=seg_start-self.RUN_OFFSETS[r]
+            for pos in range(max(bisect_right(self.ENDS, start+shift), first), min(bisect_left(self.STARTS, end+shift), last+1)):
+                if self.STARTS[pos]<self.ENDS[pos] and (len(ids)==0 or ids[-1]!=self.IDS[pos]):
+                    ids.append(self.IDS[pos])
+        return ids
+
+    def __len__(self):
+        if self.LENGTH==None:
+            self.LENGTH=sum(self.ENDS[pos]-self.STARTS[pos] for (_, first, last) in self.RUN_RANGES for pos in range(first, last+1))
+        return self.LENGTH
+
+
 # Static helper methods
 #############################################
 
 
-##############################
-class PhraseAnnotator(object):
-##############################  
+###############################################################
+class PhraseAnnotator(object):                                #
+# Phrases are matched against the rendered text of the        #
+# basedata, starting and ending at element boundaries, like   #
+# n-grams rendered with render_string(). So matching does not #
+# depend on how the basedata was tokenized. SORTED_PHRASES is #
+# used for prefix search, so that ngrams are only extended as #
+# long as some phrase starts with them. Instances can be      #
+# pickled.                                                    #
+###############################################################
     def __init__ (self, phraselist, ignore_case=True):
         self.PHRASES=set()
         self.IGNORE_CASE=ignore_case
         self.MAX_LEN=0
 
+        # All phrases are tokenized with the same basedata, which is emptied after each one
+        tokenizer=Basedata('dummy.xml')
 #        with open(phrasefile) as pin:
         for p in phraselist:
             p=p.strip()
             if p!="":
-                plen=len(Basedata('dummy.xml').add_elements_from_string(p, isolate_numbers=False))
+                plen=len(tokenizer.add_elements_from_string(p, isolate_numbers=False))
+                tokenizer.delete_all_elements()
                 #if len(p.split(" "))>self.MAX_LEN:
                 if plen>self.MAX_LEN:
                     self.MAX_LEN=plen
                 if self.IGNORE_CASE:    
                     p=p.lower()
                 self.PHRASES.add(p)
+        self.SORTED_PHRASES=sorted(self.PHRASES)
         print("PhraseAnnotator loaded",len(self.PHRASES),"phrases, ignore_case",self.IGNORE_CASE, "max phrase length",self.MAX_LEN)
 
-    def apply(self, discourse, targetlevel_name, allow_overlap=False, verbose=False):
-        elems=len(discourse.get_basedata().DCELEMENTS)
-        # Move through tokens from left to right. There should be *one* o pass only
+    # Yields (first_pos, last_pos, phrase) for all ngrams of up to MAX_LEN elements that match a phrase, ordered by first_pos,
+    # and longest first for the same first_pos. The basedata is passed once from left to right.
+    def iter_matches(self, discourse):
+        basedata=discourse.get_basedata()
+        text=basedata.get_rendered_text()
+        if text==None:
+            raise ValueError("Basedata "+str(basedata.FILENAME)+" cannot be rendered (invalid spc value)")
+        starts, ends = basedata.TEXT_STARTS, basedata.TEXT_ENDS
+        phrases=self.SORTED_PHRASES
+        elems=len(ends)
         for o in range(elems):
-            elems=len(discourse.get_basedata().DCELEMENTS)
-            # Move through tokens from right to left, start at o+MAX_LEN (no phrase will be longer)
-            for n in range(self.MAX_LEN+o,o,-1):    # o instead of o-1 will also find single-token phrases
-                if n > elems: 
-                    n=elems
-                    elems-=1
-                # Create potential ngrams from longer to shorter ones
-                ngram_span=[f[1] for f in discourse.get_basedata().DCELEMENTS[o:n]]
-                ngram = discourse.render_string(for_ids=[ngram_span])[0].strip()
+            found=[]
+            for n in range(o, min(o+self.MAX_LEN, elems)):
+                # The same as render_string(for_ids=[ngram_span])[0].strip()
+                ngram=text[starts[o]:ends[n]].strip()
                 if self.IGNORE_CASE:
                     ngram=ngram.lower()
-                if ngram in self.PHRASES:
-                    overlap=False
-                    if allow_overlap==False:
-                        # Check if the found ngram is embedded / overlapping with an already existing one on the same level
-                        for spid in ngram_span:
-                            if len(discourse.get_level(targetlevel_name).get_markables_for_bd(spid))>0:
-                                overlap=True
-                                break # leave search for overlapping markable
-                        if overlap:
-                            print("Overlap "+ngram)
-                            continue # Continue with next potential phrase
-                    if verbose: 
-                        print("Found phrase '%s' from %s to %s"%(ngram,str(o), str(n-1)))
-                    spanlist=[bd[1] for bd in discourse.get_basedata().DCELEMENTS[o:n]]
-                    # Todo: set some attributes here
-                    discourse.get_level(targetlevel_name).add_markable([spanlist])           
+                i=bisect_left(phrases, ngram)
+                if i<len(phrases) and phrases[i]==ngram:
+                    found.append((o, n, ngram))
+                # Longer ngrams start with this one, unless lower() created a final sigma
+                elif (i==len(phrases) or not phrases[i].startswith(ngram)) and not ngram.endswith('\u03c2'):
+                    break
+            yield from reversed(found)
+
+    def apply(self, discourse, targetlevel_name, allow_overlap=False, verbose=False):
+        basedata=discourse.get_basedata()
+        level=discourse.get_level(targetlevel_name)
+        for (o, n, ngram) in self.iter_matches(discourse):
+            if allow_overlap==False:
+                # Check if the found ngram is embedded / overlapping with an already existing one on the same level
+                if any(len(level.get_markables_for_bd(spid))>0 for spid in basedata.TEXT_IDS[o:n+1]):
+                    print("Overlap "+ngram)
+                    continue # Continue with next potential phrase
+            if verbose: 
+                print("Found phrase '%s' from %s to %s"%(ngram,str(o), str(n)))
+            # Todo: set some attributes here
+            level.add_markable([basedata.TEXT_IDS[o:n+1]])
 
 # spanlists is a list with one list per segment
 # This should only be necessary when serializing a markable to xml
+# Matches an & which does not start one of the predefined XML entities or a character reference.
+# lxml rejects files with these (raw &) or reads them differently (e.g. &nbsp;), while BeautifulSoup decodes them like HTML.
+NON_XML_ENTITY_PATTERN = re.compile(rb'&(?!(?:amp|lt|gt|quot|apos|#[0-9]+|#x[0-9a-fA-F]+);)')
+
+def has_non_xml_entities(xml_file):
+    with open(xml_file, "rb") as xin:
+        if os.fstat(xin.fileno()).st_size==0:
+            return False
+        with mmap.mmap(xin.fileno(), 0, access=mmap.ACCESS_READ) as xmap:
+            return NON_XML_ENTITY_PATTERN.search(xmap)!=None
+
 def spanlists_to_span(spanlists):
     span=""
     for spanlist in spanlists:
@@ -2258,10 +4235,31 @@ def spanlists_to_span(spanlists):
     return span[:-1]
 
 def span_overlap(full_span1, full_span2):
-    if set(flatten_spanlists(full_span1)).intersection(set(flatten_spanlists(full_span2))) != {}:
+    if len(set(flatten_spanlists(full_span1)).intersection(set(flatten_spanlists(full_span2)))) > 0:
         return True
     return False
 
+# Merges (start_pos, end_pos) ranges that overlap or touch, and returns them sorted
+def merge_ranges(ranges):
+    merged=[]
+    for (start, end) in sorted(ranges):
+        if merged and start<=merged[-1][1]+1:
+            if end>merged[-1][1]:
+                merged[-1]=(merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+# True if every position in inner_ranges is also in outer_ranges
+def ranges_contain(outer_ranges, inner_ranges):
+    merged=merge_ranges(outer_ranges)
+    starts=[start for (start, _) in merged]
+    for (start, end) in inner_ranges:
+        i=bisect_right(starts, start)-1
+        if i<0 or end>merged[i][1]:
+            return False
+    return True
+
 def flatten_spanlists(spanlists):
     return [item for sublist in spanlists for item in sublist]
 
@@ -2282,6 +4280,15 @@ class InvalidMMAX2AttributeException(Exception):
         # Call Exception super class
         super().__init__(self.message)
 
+    # Make this picklable (e.g. for MMAX2Corpus worker processes). 
+    # Cast to str explicitly because names and values might come from Java ...
+    def __reduce__(self):
+        return (self.__class__, (self.level, self.m_id, 
+                                {str(k):str(v) for (k,v) in self.supplied_attribs.items()}, 
+                                {str(k):str(v) for (k,v) in self.valid_attribs.items()}, 
+                                {str(k):str(v) for (k,v) in self.extra_attribs.items()}, 
+                                {str(k):str(v) for (k,v) in self.missing_attribs.items()}))
+
     def __str__(self):
         # return '\n\nLevel: '+ self.level+', ID: ' + self.m_id + f'\n{Fore.BLACK}{Style.NORMAL}Validated: ' + str(self.supplied_attribs)+f'\n{Fore.BLACK}{Back.GREEN}{Style.NORMAL}Valid:     '+str(self.valid_attribs)+f'{Style.RESET_ALL}\n{Fore.YELLOW}{Back.RED}{Style.NORMAL}Invalid:   '+str(self.extra_attribs)+f'{Style.RESET_ALL}\n{Fore.YELLOW}{Back.RED}{Style.NORMAL}Missing:   '+str(self.missing_attribs)+f'{Style.RESET_ALL}'
         return '\n\nLevel: '+ self.level+', ID: ' + self.m_id + f'\nValidated: ' + str(self.supplied_attribs)+'\nValid:     '+str(self.valid_attribs)+'\nInvalid:   '+str(self.extra_attribs)+'\nMissing:   '+str(self.missing_attribs)
@@ -2294,6 +4301,10 @@ class MultipleInvalidMMAX2AttributeExceptions(Exception):
         # Call Exception super class
         super().__init__(self.message)
 
+    # Make this picklable (e.g. for MMAX2Corpus worker processes)
+    def __reduce__(self):
+        return (self.__class__, (), {'exceptions': self.exceptions})
+
     def add(self, exc):
         self.exceptions.append(exc)
 
@@ -2320,6 +4331,10 @@ class MarkableLevelExistsException(Exception):
     def __init__(self, level):
         super().__init__("Markablelevel "+level+" already exists!")
 
+class IncompleteMarkableLevelException(Exception):
+    def __init__(self, level, reason):
+        super().__init__("Markablelevel "+level+" cannot be written, because "+reason+"!")
+
 class NoMarkableSpanException(Exception):
     def __init__(self, span):
         super().__init__("String '"+span+"' is not a markable span!")